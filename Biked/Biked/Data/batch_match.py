@@ -0,0 +1,186 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from matching import JSON_PATH, GeometryIndex, estimate_target_geometry
+
+# Bulk fit recommendations for stored rider profiles (fit-studio re-runs).
+# Riders are read in chunks from CSV or Parquet. Each chunk is matched against the whole
+# catalog in one broadcast pass over the padded (bikes x sizes) geometry matrix, and the
+# chunk size is derived from a memory budget. Chunks are spread over a process pool and
+# results are streamed out in input order while later chunks are still being computed.
+#
+# Input columns: rider_id, height_cm, inseam_cm and/or stack_mm, reach_mm
+# (measured stack/reach win over the height/inseam estimate when both are present).
+
+DEFAULT_TOP_K = 5
+MEMORY_BUDGET_MB = 64   # Per worker, for the (riders x bikes x sizes) distance block
+OUTPUT_FIELDS = ['rider_id', 'rank', 'bike_id', 'size', 'stack_mm', 'reach_mm',
+                 'target_stack_mm', 'target_reach_mm', 'distance_mm']
+
+COLUMN_ALIASES = {
+    'rider_id': ('rider_id', 'id', 'customer_id'),
+    'height': ('height_cm', 'height'),
+    'inseam': ('inseam_cm', 'inseam'),
+    'stack': ('stack_mm', 'stack'),
+    'reach': ('reach_mm', 'reach'),
+}
+
+# Worker-side catalog matrices, set once per process by _init_worker
+_stack = _reach = None
+
+def _init_worker(stack, reach):
+    global _stack, _reach
+    _stack, _reach = stack, reach
+
+def _number(value):
+    if value is None or value == '':
+        return np.nan
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+def _pick(record, field):
+    for name in COLUMN_ALIASES[field]:
+        if name in record:
+            return record[name]
+    return None
+
+def rider_targets(records):
+    """(ids, stack, reach) arrays for a list of rider dicts; NaN where nothing usable was given."""
+    ids = [str(_pick(r, 'rider_id') or i) for i, r in enumerate(records)]
+    height = np.array([_number(_pick(r, 'height')) for r in records])
+    inseam = np.array([_number(_pick(r, 'inseam')) for r in records])
+    stack = np.array([_number(_pick(r, 'stack')) for r in records])
+    reach = np.array([_number(_pick(r, 'reach')) for r in records])
+    est_stack, est_reach = estimate_target_geometry(height, inseam)
+    measured = ~np.isnan(stack) & ~np.isnan(reach)
+    return ids, np.where(measured, stack, est_stack), np.where(measured, reach, est_reach)
+
+def top_k(stack, reach, k):
+    """
+    Broadcast match of a rider chunk against the worker's catalog matrices.
+    Returns (bike index, size slot, distance) arrays of shape (riders, k), closest first.
+    """
+    d = np.hypot(_stack[None, :, :] - stack[:, None, None], _reach[None, :, :] - reach[:, None, None])
+    slot = d.argmin(axis=2)
+    best = np.take_along_axis(d, slot[:, :, None], axis=2)[:, :, 0]
+    k = min(k, best.shape[1])
+    bikes = np.argpartition(best, k - 1, axis=1)[:, :k] if k < best.shape[1] else np.tile(np.arange(k), (len(best), 1))
+    dist = np.take_along_axis(best, bikes, axis=1)
+    order = np.argsort(dist, axis=1, kind='stable')
+    bikes = np.take_along_axis(bikes, order, axis=1)
+    return bikes, np.take_along_axis(slot, bikes, axis=1), np.take_along_axis(dist, order, axis=1)
+
+def _match_chunk(args):
+    ids, stack, reach, k = args
+    bikes, slots, dist = top_k(stack, reach, k)
+    return ids, stack, reach, bikes, slots, dist
+
+def read_riders(path, chunk_rows):
+    """Yields lists of rider dicts, chunk_rows at a time, from CSV or Parquet."""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Reading Parquet needs pyarrow (pip install pyarrow).")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pylist()
+        return
+
+    with open(path, newline='', encoding='utf-8') as f:
+        chunk = []
+        for row in csv.DictReader(f):
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def ordered_map(pool, fn, iterable, window):
+    """Like pool.map, but keeps at most `window` tasks in flight so input is read lazily."""
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class ResultWriter:
+    def __init__(self, out, fmt):
+        self.out = out
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.writer(out)
+            self.writer.writerow(OUTPUT_FIELDS)
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            self.writer.writerow(row)
+        else:
+            self.out.write(json.dumps(dict(zip(OUTPUT_FIELDS, row))) + '\n')
+
+def run(riders_path, out, catalog=JSON_PATH, k=DEFAULT_TOP_K, workers=None, memory_mb=MEMORY_BUDGET_MB, fmt='csv'):
+    index = GeometryIndex.load(catalog)
+    stack_pad, reach_pad, rows = index.padded()
+    cells = max(1, stack_pad.size)
+    # Three float64 blocks of (riders x bikes x sizes) live at once in top_k
+    chunk_rows = max(1, int(memory_mb * 1024 * 1024 // (cells * 8 * 3)))
+    workers = workers or os.cpu_count() or 1
+
+    def tasks():
+        for records in read_riders(riders_path, chunk_rows):
+            ids, stack, reach = rider_targets(records)
+            yield ids, stack, reach, k
+
+    writer = ResultWriter(out, fmt)
+    riders = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(stack_pad, reach_pad)) as pool:
+        for ids, stack, reach, bikes, slots, dist in ordered_map(pool, _match_chunk, tasks(), workers * 2):
+            for i, rider_id in enumerate(ids):
+                riders += 1
+                if np.isnan(stack[i]) or np.isnan(reach[i]):
+                    continue  # No measurements for this rider
+                for rank in range(bikes.shape[1]):
+                    if not np.isfinite(dist[i, rank]):
+                        break
+                    r = rows[bikes[i, rank], slots[i, rank]]
+                    writer.write([rider_id, rank + 1, index.bike_ids[index.bike[r]], index.sizes[r],
+                                  round(float(index.stack[r]), 1), round(float(index.reach[r]), 1),
+                                  round(float(stack[i]), 1), round(float(reach[i]), 1),
+                                  round(float(dist[i, rank]), 2)])
+            out.flush()
+    return riders
+
+def main():
+    parser = argparse.ArgumentParser(description="Top-k bike/size recommendations for a file of rider profiles.")
+    parser.add_argument("riders", help="CSV or .parquet file with rider profiles.")
+    parser.add_argument("--out", default="-", help="Output file (default: stdout).")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_K, help="Bikes per rider.")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all cores).")
+    parser.add_argument("--memory-mb", type=float, default=MEMORY_BUDGET_MB,
+                        help="Distance-matrix budget per worker, sets the rider chunk size.")
+    parser.add_argument("--catalog", default=JSON_PATH, help="Path to bikes.json.")
+    args = parser.parse_args()
+
+    out = sys.stdout if args.out == "-" else open(args.out, 'w', newline='', encoding='utf-8')
+    try:
+        riders = run(args.riders, out, args.catalog, args.top, args.workers, args.memory_mb, args.format)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Matched {riders} riders.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import argparse
+import copy
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Offline benchmark of the acquisition pipeline.
+# A local stub server stands in for every host (http_client routes all requests to it
+# through BIKED_HTTP_OVERRIDE): Bing result pages with murl payloads, the Wikimedia API,
+# brand product pages with og:image and a geometry table, and images of several sizes
+# and formats (Range requests supported). Latency and 5xx/429 errors can be injected.
+# Each script runs in a scratch copy of Data/ against a synthetic catalog of the requested
+# size, and the report lists bikes/s, p50/p99 per-bike latency (from the --metrics
+# histograms) and the child's peak RSS.
+#
+#   python benchmark.py --sizes 20 2000 --latency-ms 30 --error-rate 0.02
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+JSON_PATH = os.path.join(DATA_DIR, 'bikes.json')
+DEFAULT_SIZES = (20, 2000, 20000)
+UNTHROTTLED_RATE = 1e6  # Requests/s given to every host unless --polite
+
+# script, arguments (after the catalog is in place), stage timed once per bike
+SCRIPTS = {
+    'download_images': ('download_images.py', ['--workers', '16', '--force'], 'bike'),
+    'fetch_images': ('fetch_images.py', ['--budget', '1000000'], 'bike'),
+    'geometry_scraper': ('geometry_scraper.py', [], 'fetch_page'),
+}
+
+# Image variants served by the stub: name -> (width, height, format, alpha)
+VARIANTS = {
+    'cutout': (1600, 960, 'PNG', True),
+    'photo': (1200, 800, 'JPEG', False),
+    'wide': (2000, 1200, 'WEBP', True),
+    'thumb': (300, 300, 'JPEG', False),
+    'logo': (640, 640, 'PNG', True),
+}
+BING_RESULTS = ('thumb', 'photo', 'cutout', 'wide', 'logo', 'photo')
+PAGE_PADDING = 200 * 1024  # Body bytes after <head>, like a real product page
+
+def render_variants():
+    """Encoded bytes per image variant (Pillow is only needed by the benchmark)."""
+    from PIL import Image, ImageDraw
+    images = {}
+    for name, (w, h, fmt, alpha) in VARIANTS.items():
+        img = Image.new('RGBA' if alpha else 'RGB', (w, h), (255, 255, 255, 0) if alpha else (255, 255, 255))
+        draw = ImageDraw.Draw(img)
+        r = h // 4
+        # Two wheels and a frame, so the files have realistic entropy and size
+        for cx in (w // 4, 3 * w // 4):
+            draw.ellipse([cx - r, h - 2 * r - 10, cx + r, h - 10], outline=(20, 20, 20, 255), width=max(2, r // 10))
+        draw.polygon([(w // 4, h - r - 10), (w // 2, h // 3), (3 * w // 4, h - r - 10)], outline=(200, 30, 30, 255))
+        noise = Image.effect_noise((w, h), 40).convert('L')
+        img.paste((90, 90, 90), mask=noise.point(lambda p: 255 if p > 200 else 0))
+        buf = io.BytesIO()
+        img.save(buf, fmt, **({'quality': 85} if fmt in ('JPEG', 'WEBP') else {}))
+        images[name] = buf.getvalue()
+    return images
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'BikedStub/1.0'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.count()
+        if stub.latency:
+            time.sleep(max(0.0, stub.latency + random.uniform(-stub.jitter, stub.jitter)))
+        if stub.error_rate and random.random() < stub.error_rate:
+            status = random.choice((500, 503, 429))
+            return self._send(status, b'error', 'text/plain', {'Retry-After': '0'} if status != 500 else None)
+
+        # /<scheme>/<host>/<path>?<query>
+        parsed = urlparse(self.path)
+        parts = parsed.path.split('/', 3)
+        host = parts[2] if len(parts) > 2 else ''
+        path = '/' + (parts[3] if len(parts) > 3 else '')
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+
+        if 'bing.' in host:
+            return self._bing(query)
+        if 'wikimedia.org' in host:
+            return self._wikimedia(query)
+        if re.search(r'\.(png|jpe?g|webp|ashx)$', path, re.I) or path.startswith('/img/'):
+            return self._image(path)
+        return self._page(host, path)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _bing(self, query):
+        key = hashlib.sha1(query.get('q', '').encode('utf-8')).hexdigest()[:12]
+        items = ''.join(
+            f'<a class="iusc" m="{{&quot;murl&quot;:&quot;https://cdn{i % 3}.stub-images.net/img/{variant}/{key}_{i}.'
+            f'{"jpg" if VARIANTS[variant][2] == "JPEG" else VARIANTS[variant][2].lower()}&quot;}}"></a>'
+            for i, variant in enumerate(BING_RESULTS))
+        self._send(200, f"<html><body>{items}</body></html>".encode('utf-8'), 'text/html; charset=utf-8')
+
+    def _wikimedia(self, query):
+        if query.get('list') == 'search':
+            term = query.get('srsearch', '').replace(' ', '_')
+            hits = [{'title': f"File:{term}_{i}.jpg"} for i in range(3)]
+            body = {'query': {'search': hits}}
+        else:
+            width = query.get('iiurlwidth', '1200')
+            pages = {}
+            for i, title in enumerate(query.get('titles', '').split('|')):
+                name = title.split(':', 1)[-1]
+                pages[str(-i - 1)] = {'title': title, 'imageinfo': [{
+                    'url': f"https://upload.wikimedia.org/img/photo/{name}",
+                    'thumburl': f"https://upload.wikimedia.org/img/photo/{width}px-{name}",
+                    'mime': 'image/jpeg'}]}
+            body = {'query': {'pages': pages}}
+        self._send(200, json.dumps(body).encode('utf-8'), 'application/json')
+
+    def _image(self, path):
+        variant = path.split('/')[2] if path.startswith('/img/') else 'photo'
+        data = self.server.stub.images.get(variant, self.server.stub.images['photo'])
+        fmt = VARIANTS.get(variant, VARIANTS['photo'])[2]
+        content_type = {'PNG': 'image/png', 'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}[fmt]
+        headers = {'ETag': f'"{variant}"', 'Accept-Ranges': 'bytes'}
+        if self.headers.get('If-None-Match') == headers['ETag']:
+            return self._send(304, b'', content_type, headers)
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start, end = int(match.group(1)), int(match.group(2) or len(data) - 1)
+            chunk = data[start:end + 1]
+            headers['Content-Range'] = f"bytes {start}-{start + len(chunk) - 1}/{len(data)}"
+            return self._send(206, chunk, content_type, headers)
+        self._send(200, data, content_type, headers)
+
+    def _page(self, host, path):
+        rows = ''.join(f"<tr><td>{label}</td>" + ''.join(f"<td>{base + 15 * i}</td>" for i in range(5)) + "</tr>"
+                       for label, base in (('Stack', 500), ('Reach', 370), ('Top tube', 510), ('Seat tube', 460)))
+        head = (f'<html><head><title>{host}{path}</title>'
+                f'<meta property="og:image" content="https://{host}/img/cutout/{abs(hash(path))}.png"></head>')
+        body = (f'<body><table><tr><th>Size</th><th>XS</th><th>S</th><th>M</th><th>L</th><th>XL</th></tr>{rows}'
+                f'</table><div>{"x" * PAGE_PADDING}</div></body></html>')
+        self._send(200, (head + body).encode('utf-8'), 'text/html; charset=utf-8')
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Probes and aborted downloads hang up mid-response on purpose
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+class StubServer:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, port=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.images = render_variants()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = _QuietServer(('127.0.0.1', port), StubHandler)
+        self.httpd.stub = self
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def synthetic_catalog(n, template_path=JSON_PATH):
+    """n bikes cycled from the real catalog, each with its own id, model name and product page."""
+    with open(template_path, 'r') as f:
+        templates = json.load(f)
+    bikes = []
+    for i in range(n):
+        bike = copy.deepcopy(templates[i % len(templates)])
+        bike['id'] = f"b{i + 1}"
+        bike['model'] = f"{bike['model']} {i // len(templates)}" if i >= len(templates) else bike['model']
+        slug = re.sub(r'[^a-z0-9]+', '', bike['brand'].lower()) or 'brand'
+        bike['official_url'] = f"https://www.{slug}.stub/bikes/{bike['id']}"
+        for build in bike['builds']:
+            build['images'] = ['https://placeholder.stub/none.png']
+        bikes.append(bike)
+    return bikes
+
+def scratch_copy(workdir, bikes):
+    """Data/*.py plus the synthetic bikes.json in a throwaway tree (fresh caches, journal, store)."""
+    data = os.path.join(workdir, 'Data')
+    os.makedirs(os.path.join(workdir, 'Resources', 'BikeImages'))
+    os.makedirs(data)
+    for name in os.listdir(DATA_DIR):
+        if name.endswith('.py'):
+            shutil.copy2(os.path.join(DATA_DIR, name), data)
+    with open(os.path.join(data, 'bikes.json'), 'w') as f:
+        json.dump(bikes, f, indent=4)
+    return data
+
+def _peak_rss_kb():
+    """
+    This process's high-water RSS, or its pool workers' if larger. On Linux it comes from
+    VmHWM, because ru_maxrss of an exec'd child also counts the parent's memory before exec.
+    Without /proc (macOS) ru_maxrss is used, which darwin reports in bytes instead of KB.
+    """
+    import resource
+    scale = 1024 if sys.platform == 'darwin' else 1
+    peak = 0
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    peak = int(line.split()[1])
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+    return max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale)
+
+def run_child(data_dir, script, args, stub_url, polite):
+    """Runs one script in a child process; returns (seconds, peak RSS in KB, exit code)."""
+    rss_path = os.path.join(data_dir, '.peak_rss')
+    env = dict(os.environ, BIKED_HTTP_OVERRIDE=stub_url, BIKED_BENCH_RSS=rss_path)
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', os.path.join(data_dir, script)]
+    if polite:
+        cmd.append('--polite')
+    start = time.perf_counter()
+    proc = subprocess.run(cmd + ['--'] + args, cwd=data_dir, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - start
+    if proc.returncode:
+        print(proc.stderr.decode('utf-8', errors='replace')[-2000:], file=sys.stderr)
+    try:
+        with open(rss_path) as f:
+            peak = int(f.read())
+        os.remove(rss_path)
+    except (OSError, ValueError):
+        peak = 0
+    return elapsed, peak, proc.returncode
+
+def child_main(script, args, polite):
+    """Child side: optionally lift the per-host rate limits, then run the script as __main__."""
+    import atexit
+    import runpy
+    sys.path.insert(0, os.path.dirname(script))
+    if not polite:
+        import http_client
+        import rate_control
+        rate_control.MAX_RATE = UNTHROTTLED_RATE
+        http_client.RATE_CONTROLLER = rate_control.RateController({}, default_rate=UNTHROTTLED_RATE)
+
+    def record_rss():
+        if os.environ.get('BIKED_BENCH_RSS'):
+            with open(os.environ['BIKED_BENCH_RSS'], 'w') as f:
+                f.write(str(_peak_rss_kb()))
+    atexit.register(record_rss)
+    sys.argv = [script] + args
+    runpy.run_path(script, run_name='__main__')
+
+def benchmark(sizes, scripts, latency_ms=0, jitter_ms=0, error_rate=0.0, polite=False):
+    results = []
+    with StubServer(latency_ms, jitter_ms, error_rate) as stub:
+        for n in sizes:
+            bikes = synthetic_catalog(n)
+            for name in scripts:
+                script, args, per_bike_stage = SCRIPTS[name]
+                workdir = tempfile.mkdtemp(prefix=f'biked-bench-{name}-{n}-')
+                try:
+                    data = scratch_copy(workdir, bikes)
+                    metrics_path = os.path.join(workdir, 'metrics.json')
+                    before = stub.requests
+                    elapsed, peak_kb, code = run_child(data, script, args + ['--metrics', metrics_path],
+                                                       stub.url, polite)
+                    stage = {}
+                    if os.path.exists(metrics_path):
+                        with open(metrics_path, 'r') as f:
+                            stage = json.load(f)['stages'].get(per_bike_stage, {})
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+                result = {
+                    'script': name, 'bikes': n, 'seconds': round(elapsed, 2),
+                    'bikes_per_second': round(n / elapsed, 1) if elapsed else None,
+                    'p50_seconds': stage.get('p50'), 'p99_seconds': stage.get('p99'),
+                    'peak_rss_mb': round(peak_kb / 1024, 1), 'requests': stub.requests - before,
+                    'exit_code': code,
+                }
+                results.append(result)
+                print(f"{name:<18} {n:>6} bikes  {result['seconds']:>8.2f}s  {result['bikes_per_second'] or 0:>8.1f} bikes/s  "
+                      f"p50 {result['p50_seconds']}s  p99 {result['p99_seconds']}s  "
+                      f"peak {result['peak_rss_mb']} MB  {result['requests']} requests"
+                      + ("" if code == 0 else f"  [exit {code}]"))
+    return results
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        rest = sys.argv[2:]
+        split = rest.index('--')
+        options, args = rest[:split], rest[split + 1:]
+        child_main(options[0], args, '--polite' in options)
+        return
+
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark against a local stub server.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Catalog sizes.")
+    parser.add_argument("--scripts", nargs="+", choices=sorted(SCRIPTS), default=list(SCRIPTS))
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added to every stub response.")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random +/- spread on the latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered 500/503/429.")
+    parser.add_argument("--polite", action="store_true", help="Keep the real per-host rate limits.")
+    parser.add_argument("--report", default=None, help="Write the results as JSON here.")
+    args = parser.parse_args()
+
+    results = benchmark(args.sizes, args.scripts, args.latency_ms, args.jitter_ms, args.error_rate, args.polite)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+
+import catalog_store
+import instrumentation
+from matching import GeometryIndex, estimate_target_geometry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Read-only HTTP API over the catalog the data scripts produce.
+# The whole catalog lives in memory as one published snapshot: the compact JSON body,
+# pre-compressed once per version (gzip, plus brotli when the module is installed), its
+# strong ETag, and the GeometryIndex for /match. Requests never touch the disk, and a
+# reload (polled from the catalog files' mtimes) builds the next snapshot off the event
+# loop before swapping it in.
+# Every bike, build and inventory map carries the catalog version it last changed at
+# (kept in Data/.api_versions.json so versions survive restarts), which is what the
+# /catalog/delta?since=<version> feed is cut from.
+#
+#   GET /catalog                    full catalog (bikes.json schema), ETag / If-None-Match
+#   GET /catalog/delta?since=12     changed bikes, builds and inventory since version 12
+#   GET /version                    {"version": ..., "etag": ...} for cheap polling
+#   GET /match?stack=560&reach=390  best size per bike (or height=&inseam= in cm)
+#   GET /metrics                    Prometheus text
+
+VERSIONS_PATH = os.path.join(catalog_store.DATA_DIR, '.api_versions.json')
+HOST = '127.0.0.1'
+PORT = 8080
+RELOAD_INTERVAL = 2.0       # Seconds between checks of the catalog files
+KEEPALIVE_TIMEOUT = 15.0    # Idle keep-alive connections are closed after this
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024  # Bodies are read and discarded; larger ones close the connection
+BACKLOG = 4096
+DELTA_CACHE_SIZE = 64       # Delta bodies kept per version (clients mostly share a few `since` values)
+COMPRESS_MIN_BYTES = 1024   # Smaller dynamic bodies are sent uncompressed
+MATCH_LIMIT = 50
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 410: 'Gone', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large'}
+
+def _digest(value):
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+def _bike_fields(bike):
+    return {k: v for k, v in bike.items() if k != 'builds'}
+
+def _build_fields(build):
+    return {k: v for k, v in build.items() if k != 'inventory'}
+
+def track_versions(previous, bikes):
+    """
+    Next version state for the catalog `bikes`. previous (or None) maps every bike,
+    build and inventory to [digest, version last changed]; removed bikes and builds are kept
+    as tombstones. Returns previous itself when nothing changed.
+    """
+    previous = previous or {'version': 0, 'bikes': {}, 'builds': {}, 'inventory': {}, 'removed': {}}
+    version = previous['version'] + 1
+    state = {'version': version, 'bikes': {}, 'builds': {}, 'inventory': {}, 'removed': {}}
+    changed = False
+
+    def keep(table, key, digest, old):
+        nonlocal changed
+        if old and old[0] == digest:
+            table[key] = old
+        else:
+            table[key] = [digest, version]
+            changed = True
+
+    for bike in bikes:
+        bike_id = bike['id']
+        keep(state['bikes'], bike_id, _digest(_bike_fields(bike)), previous['bikes'].get(bike_id))
+        old_builds = previous['builds'].get(bike_id, {})
+        old_inventory = previous['inventory'].get(bike_id, {})
+        builds = state['builds'][bike_id] = {}
+        inventory = state['inventory'][bike_id] = {}
+        for build in bike.get('builds', []):
+            keep(builds, build['id'], _digest(_build_fields(build)), old_builds.get(build['id']))
+            keep(inventory, build['id'], _digest(build.get('inventory', {})), old_inventory.get(build['id']))
+        # Builds dropped from a bike that is still listed
+        removed_builds = {k: v for k, v in previous['removed'].get(bike_id, {}).get('builds', {}).items()
+                          if k not in builds}
+        for build_id in old_builds.keys() - builds.keys():
+            removed_builds[build_id] = version
+            changed = True
+        if removed_builds:
+            state['removed'][bike_id] = {'builds': removed_builds}
+
+    for bike_id, entry in previous['removed'].items():
+        if 'bike' in entry and bike_id not in state['bikes']:
+            state['removed'][bike_id] = {'bike': entry['bike']}
+    for bike_id in previous['bikes'].keys() - state['bikes'].keys():
+        state['removed'][bike_id] = {'bike': version}
+        changed = True
+    return state if changed else previous
+
+def load_versions(path=VERSIONS_PATH):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class Published:
+    """One immutable catalog version as served: bodies, ETags, match index, delta source."""
+    def __init__(self, bikes, versions):
+        self.bikes = {b['id']: b for b in bikes}
+        self.versions = versions
+        self.version = versions['version']
+        body = json.dumps(bikes, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        tag = hashlib.sha256(body).hexdigest()[:32]
+        # Strong ETags differ per content coding, but any of them revalidates the version
+        self.bodies = {'identity': (body, f'"{tag}"'),
+                       'gzip': (gzip.compress(body, 9, mtime=0), f'"{tag}-gz"')}
+        if brotli:
+            self.bodies['br'] = (brotli.compress(body, quality=11), f'"{tag}-br"')
+        self.etags = {etag for _, etag in self.bodies.values()}
+        self.etag = self.bodies['identity'][1]
+        self.index = GeometryIndex.from_catalog(bikes)
+        self.deltas = {}
+
+    def delta(self, since):
+        """Everything that changed after version `since`, as one JSON-able dict."""
+        v = self.versions
+        out = {'version': self.version, 'since': since, 'bikes': [], 'builds': [], 'inventory': [],
+               'removed': {'bikes': [], 'builds': []}}
+        for bike_id, (_, changed) in v['bikes'].items():
+            bike = self.bikes[bike_id]
+            if changed > since:
+                out['bikes'].append(_bike_fields(bike))
+            builds = {b['id']: b for b in bike.get('builds', [])}
+            for build_id, (_, changed) in v['builds'][bike_id].items():
+                if changed > since:
+                    out['builds'].append(dict(_build_fields(builds[build_id]), bike_id=bike_id))
+            for build_id, (_, changed) in v['inventory'][bike_id].items():
+                if changed > since:
+                    out['inventory'].append({'bike_id': bike_id, 'build_id': build_id,
+                                             'inventory': builds[build_id].get('inventory', {})})
+        for bike_id, entry in v['removed'].items():
+            if entry.get('bike', 0) > since:
+                out['removed']['bikes'].append(bike_id)
+            for build_id, changed in entry.get('builds', {}).items():
+                if changed > since:
+                    out['removed']['builds'].append({'bike_id': bike_id, 'build_id': build_id})
+        return out
+
+def _source_stamp(json_path, root):
+    """mtime/size of every file the catalog is read from; a change triggers a reload."""
+    paths = [json_path]
+    if os.path.isdir(root):
+        paths.extend(os.path.join(root, name) for name in sorted(os.listdir(root)))
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        stamp.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+def _accepts(header):
+    """Content codings the client accepts (q > 0)."""
+    codings = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            codings.add(name.strip().lower())
+    return codings
+
+def _etag_matches(header, etags):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') in etags for tag in header.split(','))
+
+class CatalogServer:
+    def __init__(self, json_path=catalog_store.JSON_PATH, root=catalog_store.CATALOG_DIR,
+                 versions_path=VERSIONS_PATH, reload_interval=RELOAD_INTERVAL):
+        self.json_path = json_path
+        self.root = root
+        self.versions_path = versions_path
+        self.reload_interval = reload_interval
+        self.current = None
+        self._stamp = None
+
+    def _build(self):
+        """Loads the catalog and builds the next Published (runs in a worker thread)."""
+        with instrumentation.stage('api_reload'):
+            bikes = list(catalog_store.open_catalog(self.json_path, self.root))
+            previous = self.current.versions if self.current else load_versions(self.versions_path)
+            versions = track_versions(previous, bikes)
+            if versions is not previous or not os.path.exists(self.versions_path):
+                catalog_store.write_json_atomic(self.versions_path, versions, indent=None)
+            return Published(bikes, versions)
+
+    async def reload(self):
+        loop = asyncio.get_running_loop()
+        stamp = await loop.run_in_executor(None, _source_stamp, self.json_path, self.root)
+        if stamp == self._stamp:
+            return False
+        published = await loop.run_in_executor(None, self._build)
+        self._stamp = stamp
+        changed = self.current is None or published.version != self.current.version
+        self.current = published
+        if changed:
+            print(f"Serving catalog version {published.version}: {len(published.bikes)} bikes, "
+                  f"{len(published.bodies['identity'][0]) // 1024} KB "
+                  f"({', '.join(f'{k} {len(v[0]) // 1024} KB' for k, v in published.bodies.items() if k != 'identity')})")
+        return changed
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                print(f"   [Reload failed] {e}")
+
+    # --- Routes: each returns (status, body bytes, content type, extra headers) ---
+
+    def _catalog(self, query, headers):
+        pub = self.current
+        base = {'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache',
+                'X-Catalog-Version': str(pub.version)}
+        accepted = _accepts(headers.get('accept-encoding'))
+        coding = next((c for c in ('br', 'gzip') if c in pub.bodies and c in accepted), 'identity')
+        body, etag = pub.bodies[coding]
+        base['ETag'] = etag
+        if _etag_matches(headers.get('if-none-match'), pub.etags):
+            return 304, b'', 'application/json', base
+        if coding != 'identity':
+            base['Content-Encoding'] = coding
+        return 200, body, 'application/json', base
+
+    def _delta(self, query, headers):
+        pub = self.current
+        try:
+            since = int(query.get('since', ''))
+        except ValueError:
+            return self._error(400, 'since=<version> is required')
+        if since > pub.version or since < 0:
+            return self._error(410, f'unknown version {since}; fetch /catalog (current {pub.version})')
+        cached = pub.deltas.get(since)
+        if cached is None:
+            body = json.dumps(pub.delta(since), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            cached = (body, gzip.compress(body, 6, mtime=0) if len(body) >= COMPRESS_MIN_BYTES else None)
+            if len(pub.deltas) >= DELTA_CACHE_SIZE:
+                pub.deltas.pop(next(iter(pub.deltas)))
+            pub.deltas[since] = cached
+        body, zipped = cached
+        tag = f'v{pub.version}-since{since}'
+        etags = {f'"{tag}"', f'"{tag}-gz"'}
+        base = {'ETag': f'"{tag}"', 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache',
+                'X-Catalog-Version': str(pub.version)}
+        if zipped is not None and 'gzip' in _accepts(headers.get('accept-encoding')):
+            # Same per-coding strong ETags as /catalog; either one revalidates
+            base['ETag'] = f'"{tag}-gz"'
+            base['Content-Encoding'] = 'gzip'
+            body = zipped
+        if _etag_matches(headers.get('if-none-match'), etags):
+            base.pop('Content-Encoding', None)
+            return 304, b'', 'application/json', base
+        return 200, body, 'application/json', base
+
+    def _version(self, query, headers):
+        pub = self.current
+        return self._json({'version': pub.version, 'etag': pub.etag, 'bikes': len(pub.bikes)},
+                          {'Cache-Control': 'no-cache'})
+
+    def _match(self, query, headers):
+        try:
+            if 'height' in query and 'inseam' in query:
+                stack, reach = (float(v) for v in estimate_target_geometry(float(query['height']),
+                                                                             float(query['inseam'])))
+            else:
+                stack, reach = float(query['stack']), float(query['reach'])
+            tolerance = float(query['tolerance']) if 'tolerance' in query else None
+            limit = int(query.get('limit', MATCH_LIMIT))
+        except (KeyError, ValueError):
+            return self._error(400, 'stack=&reach= (mm) or height=&inseam= (cm) are required')
+        if limit < 1:
+            return self._error(400, 'limit must be at least 1')
+        limit = min(limit, MATCH_LIMIT)
+        pub = self.current
+        matches = pub.index.best_per_bike(stack, reach, tolerance, limit)
+        return self._json({'version': pub.version, 'stack': stack, 'reach': reach,
+                           'matches': [m._asdict() for m in matches]})
+
+    def _metrics(self, query, headers):
+        return 200, instrumentation.METRICS.prometheus().encode('utf-8'), 'text/plain; version=0.0.4', {}
+
+    ROUTES = {'/catalog': _catalog, '/catalog/delta': _delta, '/version': _version,
+              '/match': _match, '/metrics': _metrics}
+
+    def _json(self, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return 200, body, 'application/json', headers or {}
+
+    def _error(self, status, message):
+        body = json.dumps({'error': message}).encode('utf-8')
+        return status, body, 'application/json', {}
+
+    def respond(self, method, target, headers):
+        """(status, body, content type, headers) for one request."""
+        url = urlparse(target)
+        route = self.ROUTES.get(url.path.rstrip('/') or '/')
+        if route is None:
+            return url.path, self._error(404, 'not found')
+        if method not in ('GET', 'HEAD'):
+            return url.path, self._error(405, 'only GET and HEAD')
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        return url.path, route(self, query, headers)
+
+    # --- HTTP/1.1 over asyncio streams ---
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+                except asyncio.LimitOverrunError:
+                    await self._write(writer, 'GET', 'HTTP/1.1', self._error(431, 'headers too large'), False)
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, protocol = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._write(writer, 'GET', 'HTTP/1.1', self._error(400, 'bad request line'), False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(':')
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                length = headers.get('content-length', '0')
+                if not length.isdigit():
+                    await self._write(writer, method, protocol, self._error(400, 'bad Content-Length'), False)
+                    break
+                if int(length) > MAX_BODY_BYTES:
+                    await self._write(writer, method, protocol, self._error(413, 'request body too large'), False)
+                    break
+                if int(length):
+                    await reader.readexactly(int(length))  # Ignored: every route is read-only
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if protocol == 'HTTP/1.1' else connection == 'keep-alive'
+
+                start = time.perf_counter()
+                path, response = self.respond(method, target, headers)
+                instrumentation.METRICS.observe('stage', 'api_' + (path.strip('/').replace('/', '_') or 'root')
+                                                if response[0] != 404 else 'api_not_found',
+                                                time.perf_counter() - start)
+                instrumentation.METRICS.count('api_responses', status=response[0])
+                await self._write(writer, method, protocol, response, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _write(self, writer, method, protocol, response, keep_alive):
+        status, body, content_type, extra = response
+        lines = [f"{protocol if protocol.startswith('HTTP/') else 'HTTP/1.1'} {status} {REASONS.get(status, '')}",
+                 f"Content-Type: {content_type}", f"Content-Length: {len(body)}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines.extend(f"{k}: {v}" for k, v in extra.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if method != 'HEAD' and status != 304:
+            writer.write(body)
+        await writer.drain()
+
+    async def serve(self, host=HOST, port=PORT):
+        await self.reload()
+        server = await asyncio.start_server(self.handle, host, port, backlog=BACKLOG, limit=MAX_HEADER_BYTES)
+        print(f"Catalog API on http://{host}:{port} (brotli {'on' if brotli else 'off'})")
+        watcher = asyncio.create_task(self._watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the bike catalog over HTTP with ETags and delta feeds.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--json", default=catalog_store.JSON_PATH, help="Legacy bikes.json path.")
+    parser.add_argument("--root", default=catalog_store.CATALOG_DIR, help="Sharded catalog directory.")
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL,
+                        help="Seconds between checks for catalog changes.")
+    args = parser.parse_args()
+
+    server = CatalogServer(args.json, args.root, reload_interval=args.reload_interval)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import re
+import textwrap
+from contextlib import contextmanager
+
+import instrumentation
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # No flock on Windows: run one writer at a time there
+
+# Sharded NDJSON catalog storage.
+# One bike per line, one shard file per brand (catalog/<brand>.ndjson). Records are
+# streamed line by line, and an upsert rewrites only the affected shard through a temp
+# file + atomic rename, so memory stays flat however large the catalog gets and an
+# interrupted write never corrupts existing data.
+# export_json() regenerates the legacy bikes.json the app decodes.
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+CATALOG_DIR = os.path.join(DATA_DIR, 'catalog')
+JSON_PATH = os.path.join(DATA_DIR, 'bikes.json')
+ORDER_FILE = '_shards.json'  # Shard order (first appearance of each brand) for stable exports
+
+def shard_name(brand):
+    slug = re.sub(r'[^a-z0-9]+', '-', (brand or 'unknown').lower()).strip('-')
+    return f"{slug or 'unknown'}.ndjson"
+
+def _encode(bike):
+    return json.dumps(bike, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+def write_json_atomic(path, data, indent=4):
+    """json.dump to a temp file next to path, then rename over it."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+@contextmanager
+def locked(path):
+    """Exclusive cross-process lock on path (created if missing); yields the open lock file."""
+    with open(path, 'a+', encoding='utf-8') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class CatalogStore:
+    def __init__(self, root=CATALOG_DIR):
+        self.root = root
+
+    def exists(self):
+        return os.path.isdir(self.root) and bool(self.shards())
+
+    def _order_path(self):
+        return os.path.join(self.root, ORDER_FILE)
+
+    def shards(self):
+        """Shard file names, in export order."""
+        if not os.path.isdir(self.root):
+            return []
+        present = sorted(n for n in os.listdir(self.root) if n.endswith('.ndjson'))
+        order = []
+        if os.path.exists(self._order_path()):
+            with open(self._order_path(), 'r') as f:
+                order = [n for n in json.load(f) if n in present]
+        return order + [n for n in present if n not in order]
+
+    def _remember_shard(self, name):
+        order = self.shards()
+        if name not in order:
+            order.append(name)
+            tmp = self._order_path() + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(order, f, indent=2)
+            os.replace(tmp, self._order_path())
+
+    def iter_shard(self, name):
+        path = os.path.join(self.root, name)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_bikes(self):
+        """Streams every bike, one record at a time."""
+        for name in self.shards():
+            yield from self.iter_shard(name)
+
+    def get(self, bike_id, brand=None):
+        names = [shard_name(brand)] if brand else self.shards()
+        for name in names:
+            for bike in self.iter_shard(name):
+                if bike['id'] == bike_id:
+                    return bike
+        return None
+
+    def _rewrite(self, name, updates, removals=()):
+        """
+        Streams a shard into a temp file, replacing records whose id is in updates
+        (appending the new ones) and dropping ids in removals, then renames it in place.
+        Returns the ids that were not present before (inserts).
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, name)
+        tmp = path + '.tmp'
+        pending = dict(updates)
+        with open(tmp, 'w', encoding='utf-8') as out:
+            for bike in self.iter_shard(name):
+                if bike['id'] in removals:
+                    continue
+                out.write(_encode(pending.pop(bike['id'], bike)))
+            for bike in pending.values():
+                out.write(_encode(bike))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+        self._remember_shard(name)
+        return set(pending)
+
+    def upsert_many(self, bikes):
+        """Atomic per-shard upsert: one streaming rewrite per affected brand."""
+        by_shard = {}
+        for bike in bikes:
+            by_shard.setdefault(shard_name(bike.get('brand')), {})[bike['id']] = bike
+        inserted = set()
+        for name, updates in by_shard.items():
+            inserted |= self._rewrite(name, updates)
+        if inserted:
+            # A new id in one shard may be a bike whose brand changed: drop stale copies
+            for name in self.shards():
+                stale = inserted - set(by_shard.get(name, {}))
+                if stale and any(b['id'] in stale for b in self.iter_shard(name)):
+                    self._rewrite(name, {}, removals=stale)
+
+    def upsert(self, bike):
+        self.upsert_many([bike])
+
+    def remove(self, bike_id):
+        for name in self.shards():
+            if any(b['id'] == bike_id for b in self.iter_shard(name)):
+                self._rewrite(name, {}, removals={bike_id})
+
+    def import_json(self, path=JSON_PATH):
+        """Splits a legacy bikes.json into brand shards (replaces the current catalog)."""
+        with open(path, 'r') as f:
+            bikes = json.load(f)
+        os.makedirs(self.root, exist_ok=True)
+        handles = {}
+        order = []
+        try:
+            for bike in bikes:
+                name = shard_name(bike.get('brand'))
+                if name not in handles:
+                    handles[name] = open(os.path.join(self.root, name + '.tmp'), 'w', encoding='utf-8')
+                    order.append(name)
+                handles[name].write(_encode(bike))
+        finally:
+            for handle in handles.values():
+                handle.close()
+        for name in self.shards():
+            if name not in handles:
+                os.remove(os.path.join(self.root, name))
+        for name in order:
+            os.replace(os.path.join(self.root, name + '.tmp'), os.path.join(self.root, name))
+        with open(self._order_path(), 'w') as f:
+            json.dump(order, f, indent=2)
+        return len(bikes)
+
+    def export_json(self, path=JSON_PATH):
+        """
+        Streams the catalog into the legacy bikes.json layout (same bytes as
+        json.dump(bikes, f, indent=4)), written to a temp file and renamed.
+        """
+        tmp = f"{path}.tmp"
+        count = 0
+        with open(tmp, 'w') as f:
+            f.write('[')
+            for bike in self.iter_bikes():
+                f.write(',\n' if count else '\n')
+                f.write(textwrap.indent(json.dumps(bike, indent=4), '    '))
+                count += 1
+            f.write('\n]' if count else ']')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return count
+
+class LegacyCatalog:
+    """The whole bikes.json in memory; written back atomically on commit()."""
+    def __init__(self, path=JSON_PATH):
+        self.path = path
+        with instrumentation.stage('catalog_load'), open(path, 'r') as f:
+            self.bikes = json.load(f)
+
+    def __iter__(self):
+        return iter(self.bikes)
+
+    def save(self, bike):
+        pass  # Records are mutated in place and written by commit()
+
+    def save_many(self, bikes):
+        pass
+
+    def commit(self):
+        with instrumentation.stage('catalog_save'):
+            write_json_atomic(self.path, self.bikes)
+
+class ShardedCatalog:
+    """Streams records from the NDJSON shards; save() is a per-record atomic upsert."""
+    def __init__(self, store, json_path=JSON_PATH):
+        self.store = store
+        self.json_path = json_path
+
+    def __iter__(self):
+        return self.store.iter_bikes()
+
+    def save(self, bike):
+        with instrumentation.stage('catalog_upsert'):
+            self.store.upsert(bike)
+
+    def save_many(self, bikes):
+        with instrumentation.stage('catalog_upsert'):
+            self.store.upsert_many(bikes)  # One rewrite per affected shard
+
+    def commit(self):
+        with instrumentation.stage('catalog_save'):
+            self.store.export_json(self.json_path)
+
+def open_catalog(json_path=JSON_PATH, root=CATALOG_DIR):
+    """The sharded catalog when it has been imported, else the legacy bikes.json."""
+    store = CatalogStore(root)
+    if store.exists():
+        return ShardedCatalog(store, json_path)
+    return LegacyCatalog(json_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded NDJSON bike catalog.")
+    parser.add_argument("command", choices=["import", "export", "stats"])
+    parser.add_argument("--json", default=JSON_PATH, help="Legacy bikes.json path.")
+    parser.add_argument("--root", default=CATALOG_DIR, help="Catalog directory.")
+    args = parser.parse_args()
+
+    store = CatalogStore(args.root)
+    if args.command == "import":
+        print(f"Imported {store.import_json(args.json)} bikes into {len(store.shards())} shards.")
+    elif args.command == "export":
+        print(f"Exported {store.export_json(args.json)} bikes to {args.json}.")
+    else:
+        for name in store.shards():
+            print(f"{name}: {sum(1 for _ in store.iter_shard(name))} bikes")
+
+if __name__ == "__main__":
+    main()
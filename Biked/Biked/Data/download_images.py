@@ -1,61 +1,101 @@
+import argparse
 import json
 import os
-import time
 import re
-import requests
-from bs4 import BeautifulSoup
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from urllib.parse import urlparse, unquote
 
+import requests
+
+import catalog_store
+import http_client
+import image_probe
+import image_store
+import instrumentation
+import page_meta
+import rate_control
+import refresh_journal
+import refresh_scheduler
+import search_cache
+import strategies
+
 # Configuration
 JSON_PATH = 'bikes.json'
 # Path relative to build/data script location
 IMAGE_DIR = os.path.join(os.path.dirname(__file__), '..', 'Resources', 'BikeImages')
-FORCE_DOWNLOAD = True # Force re-download to fix missing/bad images
-
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-    'Accept-Language': 'en-US,en;q=0.9',
-}
+MIN_IMAGE_BYTES = 3000 # Smaller files are 1x1 pixels or thumbnails
+HEDGE_DELAY = strategies.HEDGE_DELAY # Seconds before the next image source starts speculatively
+PROBE_CANDIDATES = 6 # Search results probed and ranked per query
+MAX_IMAGE_BYTES = http_client.MAX_IMAGE_BYTES # Skip huge originals (override with --max-image-mb)
+REVALIDATE_REASONS = ('force', 'stale') # Refreshes that must ask the server even for known image URLs
 
 def setup_directories():
     if not os.path.exists(IMAGE_DIR):
         os.makedirs(IMAGE_DIR)
 
-def get_og_image(url):
+def _is_cancelled(cancelled):
+    return cancelled is not None and cancelled.is_set()
+
+@instrumentation.timed('get_og_image')
+def get_og_image(url, cancelled=None):
     try:
         if not url or "http" not in url: return None
+        if _is_cancelled(cancelled): return None
         print(f"    Fallback: Checking official URL metadata...")
-        # Use a standard browser header
-        meta_headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        response = requests.get(url, headers=meta_headers, timeout=10)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Fix: Use attrs={'property': ...} or attrs={'name': ...} to avoid name arg conflict
-            og = soup.find("meta", attrs={"property": "og:image"})
-            if og and og.get("content"): 
-                return og["content"]
-                
-            tw = soup.find("meta", attrs={"name": "twitter:image"})
-            if tw and tw.get("content"): 
-                return tw["content"]
-                
-            # Try generic link rel=image_src
-            link = soup.find("link", rel="image_src")
-            if link and link.get("href"):
-                return link["href"]
-                
+        # Only the page <head> is streamed and parsed; results are cached per official_url
+        return page_meta.head_image(url)
+    except TRANSIENT_ERRORS as e:
+        print(f"    Metadata error: {e}")
+        raise
     except Exception as e:
         print(f"    Metadata error: {e}")
     return None
 
-def search_image(query, transparent=False):
+class SearchError(Exception):
+    """Transport-level search failure (never cached, unlike an empty result)."""
+
+# Failures of the run rather than of the bike (breaker open, network down, search engine
+# refusing): the bike is journaled as 'deferred' and retried next run without backoff.
+TRANSIENT_ERRORS = (SearchError, rate_control.HostUnavailable, requests.RequestException)
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)  # Image responses that say "later", not "no"
+
+def bing_image_urls(query, filters):
+    """Returns every 'murl' found on the Bing Images result page for query."""
+    base_url = "https://www.bing.com/images/search"
+    params = {
+        "q": query,
+        "qft": filters,
+        "form": "HDRSC2", 
+        "first": "1"
+    }
+    
+    bing_headers = {'Referer': 'https://www.bing.com/'}
+    
+    response = http_client.get(base_url, params=params, headers=bing_headers, timeout=10)
+    
+    if response.status_code != 200:
+        raise SearchError(f"Bing Error: HTTP {response.status_code}")
+        
+    content = response.text
+    
+    # Bing embeds images in 'murl' (Media URL) inside the HTML source
+    # Regex to find "murl":"https://..."
+    # Pattern: murl&quot;:&quot;(https://.*?)&quot; or murl":"(https://.*?)"
+    
+    urls = re.findall(r'murl&quot;:&quot;(https://.*?\.(?:png|jpg|jpeg|webp))&quot;', content)
+    if not urls:
+         urls = re.findall(r'murl":"(https://.*?\.(?:png|jpg|jpeg|webp))"', content)
+    return urls
+
+@instrumentation.timed('search_image')
+def search_image(query, transparent=False, cancelled=None):
+    """
+    Best Bing image for query. cancelled (set by the hedged cascade once another source
+    has won) stops the search before its probes.
+    """
     try:
         ts_msg = " [Trans]" if transparent else ""
-        print(f"    Searching Bing{ts_msg}: {query}")
         
         # Bing Images URL
         # qft=+filterui:photo-transparent for transparent images
@@ -64,183 +104,408 @@ def search_image(query, transparent=False):
         if transparent:
             filters += "+filterui:photo-transparent"
             
-        base_url = "https://www.bing.com/images/search"
-        params = {
-            "q": query,
-            "qft": filters,
-            "form": "HDRSC2", 
-            "first": "1"
-        }
-        
-        bing_headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Referer': 'https://www.bing.com/'
-        }
-        
-        response = requests.get(base_url, params=params, headers=bing_headers, timeout=10)
+        cache = search_cache.get_cache()
+        hit, urls = cache.get('bing', query, filters)
+        if hit:
+            print(f"    Bing{ts_msg} (cached): {query}")
+        else:
+            print(f"    Searching Bing{ts_msg}: {query}")
+            urls = bing_image_urls(query, filters)
+            cache.put('bing', query, urls, filters)
         
-        if response.status_code != 200:
-            print(f"    Bing Error: HTTP {response.status_code}")
+        candidates = [u for u in urls if 'bing' not in u.lower()][:PROBE_CANDIDATES]
+        if _is_cancelled(cancelled):
             return None
-            
-        content = response.text
         
-        # Bing embeds images in 'murl' (Media URL) inside the HTML source
-        # Regex to find "murl":"https://..."
-        # Pattern: murl&quot;:&quot;(https://.*?)&quot; or murl":"(https://.*?)"
-        
-        urls = re.findall(r'murl&quot;:&quot;(https://.*?\.(?:png|jpg|jpeg|webp))&quot;', content)
-        if not urls:
-             urls = re.findall(r'murl":"(https://.*?\.(?:png|jpg|jpeg|webp))"', content)
-        
-        for u in urls:
-            u_lower = u.lower()
-            if 'bing' in u_lower: continue
-            
-            # Return first finding
-            return u
+        # Probe the top candidates in parallel (header bytes only) and keep the best one
+        # instead of trusting the first murl (logos, thumbnails)
+        best, info = image_probe.best_candidate(candidates, cancelled)
+        if best:
+            if info:
+                alpha = " alpha" if info['alpha'] else ""
+                print(f"    Best of {len(candidates)}: {info['format']} {info['width']}x{info['height']}{alpha}")
+            return best
             
+    except SearchError as e:
+        print(f"    {e}")
+        raise
+    except TRANSIENT_ERRORS as e:
+        print(f"    Search error: {e}")
+        raise
     except Exception as e:
         print(f"    Search error: {e}")
     return None
 
-def download_image(img_url, bike_id):
+def image_path_for(bike_id):
+    def resolve(content_type):
+        ext = 'jpg'
+        if 'png' in content_type: ext = 'png'
+        elif 'webp' in content_type: ext = 'webp'
+        return os.path.join(IMAGE_DIR, f"{bike_id}.{ext}")
+    return resolve
+
+@instrumentation.timed('download_image')
+def download_image(img_url, bike_id, revalidate=False):
+    """
+    Saves img_url as the bike's image. A URL already in the image store is linked from its
+    blob without a request, unless revalidate is set (--force, stale refreshes): then the
+    server is asked again with the stored validators and an unchanged image costs a 304.
+    """
     try:
         if not img_url or not img_url.startswith('http'): return None
+        store = image_store.get_store()
+        known = None if revalidate else store.find_url(img_url)
+        if known:
+            # Same URL already fetched (other bike or earlier run): link the stored blob
+            digest, ext = known
+            filename = f"{bike_id}{ext}"
+            store.link(digest, 'BikeImages', filename, url=img_url, folder=IMAGE_DIR)
+            print(f"    Reusing stored image for {filename}")
+            return filename
+
         print(f"    Downloading: {img_url}")
         
-        response = requests.get(img_url, headers=HEADERS, timeout=15)
-        if response.status_code == 200:
-            ext = 'jpg'
-            ct = response.headers.get('content-type', '').lower()
-            if 'png' in ct: ext = 'png'
-            elif 'webp' in ct: ext = 'webp'
-            
-            filename = f"{bike_id}.{ext}"
-            filepath = os.path.join(IMAGE_DIR, filename)
-            
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            
-            size = os.path.getsize(filepath)
-            if size < 3000: # Increase min size to avoid 1x1 pixels or thumbnails
-                print(f"    File too small ({size} bytes). Deleting.")
-                os.remove(filepath)
-                return None
-                
-            print(f"    Saved {filename} ({size//1024} KB)")
-            return filename
+        # Streamed to a temp file and renamed into place; HTML error pages, thumbnails
+        # (< MIN_IMAGE_BYTES, avoids 1x1 pixels) and huge originals are rejected early.
+        # An unchanged image already on disk costs a 304.
+        filepath, size, not_modified = http_client.download_file(
+            img_url, image_path_for(bike_id),
+            min_bytes=MIN_IMAGE_BYTES, max_bytes=MAX_IMAGE_BYTES, timeout=15)
+        filename = os.path.basename(filepath)
+        store.add_file(filepath, 'BikeImages', url=img_url)
+        if not_modified:
+            print(f"    Not modified, keeping {filename}")
         else:
-            print(f"    Download failed: HTTP {response.status_code}")
+            print(f"    Saved {filename} ({size//1024} KB)")
+        return filename
+    except http_client.DownloadRejected as e:
+        print(f"    Download rejected: {e}")
+        if e.status in TRANSIENT_STATUSES:
+            raise
+    except TRANSIENT_ERRORS as e:
+        print(f"    Download exception: {e}")
+        raise
     except Exception as e:
         print(f"    Download exception: {e}")
     return None
 
+# DIRECT URL OVERRIDES (Stubborn bikes)
+DIRECT_URLS = {
+    "b2": "https://www.canyon.com/dw/image/v2/BCML_PRD/on/demandware.static/-/Sites-canyon-master/default/dw8e82755e/images/full/full_2024_/2024_/full_2024_Aeroad-CFR-Di2_3943_P04_P5.png?sw=1000&sh=1000&sm=fit&sfrm=png",
+    "b4": "https://www.reveduvelo.com/2645-large_default/pinarello-dogma-f-dura-ace-di2-luxter-blue-2025-road-bike.jpg",
+    "b5": "https://www.cannondale.com/-/media/images/product-images/supersix-evo/lab71-team/team/c23_c11082u_supersix_evo_lab71_team_team_3.ashx",
+    "b8": "https://cdn.road.cc/sites/default/files/2024%20Orbea%20Orca%20Aero%20M10i%20LTD%20-%202.jpg",
+    "b9": "https://bikeinsights.com/images/bikes/640f1a4a4f8b9e001dfa84b1.jpg",
+    "b15": "https://www.vitoriabikes.es/wp-content/uploads/2023/10/Nyxtralight-Electric-Blue-1.jpg"
+}
+
+# Hardcoded Manual Queries for remaining cases
+MANUAL_QUERIES = {
+    "b2": "Canyon Aeroad CFR side profile 2024",
+    "b4": "Pinarello Dogma F 2025 side view",
+    "b5": "Cannondale SuperSix EVO LAB71 side view",
+    "b8": "Orbea Orca Aero 2024 side profile",
+    "b9": "Scott Foil RC 2024 side view",
+    "b15": "Vitoria Nyxtralight road bike side view",
+}
+
+def image_strategies(bike, preferred=None):
+    """
+    Image sources for a bike, highest priority first, as (name, callable) pairs; each
+    callable takes the cascade's cancelled event (see strategies.run_hedged).
+    preferred (the bike's last winning strategy) is moved to the front.
+    """
+    brand, model = bike['brand'], bike['model']
+    sources = []
+
+    # 1. Try Direct URL first
+    if bike['id'] in DIRECT_URLS:
+        sources.append(('direct_url', lambda cancelled: DIRECT_URLS[bike['id']]))
+
+    # Custom Override: S-Works (full bike with wheels)
+    if bike['id'] == 'b1':
+        sources.append(('override_b1', lambda cancelled: search_image(
+            "Specialized S-Works Tarmac SL8 Dura Ace Di2 side view full bike png", transparent=True,
+            cancelled=cancelled)))
+        
+    # Manual Query Override: transparent first, then normal
+    if bike['id'] in MANUAL_QUERIES:
+        query = MANUAL_QUERIES[bike['id']]
+        sources.append(('manual_transparent', lambda cancelled: search_image(query, True, cancelled)))
+        sources.append(('manual_normal', lambda cancelled: search_image(query, False, cancelled)))
+        
+    # STRATEGY 1: Transparent Search (Specific)
+    sources.append(('specific_transparent', lambda cancelled: search_image(
+        f"{brand} {model} {bike['year']} side profile", transparent=True, cancelled=cancelled)))
+    # STRATEGY 2: Transparent Search (Generic)
+    sources.append(('generic_transparent', lambda cancelled: search_image(
+        f"{brand} {model} road bike", transparent=True, cancelled=cancelled)))
+    # STRATEGY 3: Normal Search (Detailed)
+    sources.append(('detailed_normal', lambda cancelled: search_image(
+        f"{brand} {model} side view", transparent=False, cancelled=cancelled)))
+    # STRATEGY 4: Official Site Metadata (Last resort)
+    sources.append(('og_image', lambda cancelled: get_og_image(bike.get('official_url'), cancelled)))
+    sources.sort(key=lambda source: source[0] != preferred)
+    return sources
+
+def find_image_url(bike, preferred=None, errors=None):
+    """
+    Runs the image sources as a hedged cascade: lower-priority sources start after a short
+    delay instead of waiting for every timeout above them. Returns (url, strategy name).
+    """
+    img_url, strategy = strategies.run_hedged(image_strategies(bike, preferred), hedge_delay=HEDGE_DELAY,
+                                              errors=errors)
+    if img_url:
+        print(f"  [{bike['id']}] Winning strategy: {strategy}")
+    return img_url, strategy
+
+@instrumentation.timed('bike')
+def process_bike(bike, preferred=None, revalidate=False):
+    """
+    Finds and downloads one bike's image. Returns (saved filename or None, winning strategy,
+    deferred): deferred is True when nothing was saved because of a transient error
+    (see TRANSIENT_ERRORS) rather than because no usable image exists.
+    """
+    print(f"\nProcessing [{bike['id']}] {bike['brand']} {bike['model']}...")
+    errors = []
+    img_url, strategy = find_image_url(bike, preferred, errors)
+
+    # DOWNLOAD
+    if img_url:
+        try:
+            local = download_image(img_url, bike['id'], revalidate)
+        except TRANSIENT_ERRORS + (http_client.DownloadRejected,):
+            # download_image only lets rejections through for TRANSIENT_STATUSES
+            print("    [Deferred] Download interrupted by a transient error.")
+            return None, strategy, True
+        if not local:
+            print("    [Error] Found info but failed to download/save valid image.")
+        return local, strategy, False
+
+    if any(isinstance(e, TRANSIENT_ERRORS) for e in errors):
+        print("    [Deferred] Some sources could not be reached; retrying next run.")
+        return None, None, True
+    print("    [Fail] No image found after all attempts.")
+    return None, None, False
+
+def apply_image(bike, local):
+    """Points every build's first image at local. Returns True if anything changed."""
+    changed = False
+    for b in bike['builds']:
+        if b['images'] and b['images'][0] == local: continue
+        if b['images']: b['images'][0] = local
+        else: b['images'] = [local]
+        changed = True
+    return changed
+
+def local_image(bike):
+    """Returns (filename, size) of the bike's current local image, or (None, None)."""
+    current_image = bike['builds'][0]['images'][0]
+    if current_image.startswith("http"):
+        return None, None
+    possible_path = os.path.join(IMAGE_DIR, current_image)
+    if os.path.exists(possible_path) and os.path.getsize(possible_path) > MIN_IMAGE_BYTES:
+        return current_image, os.path.getsize(possible_path)
+    return None, None
+
+def bike_fingerprint(bike):
+    return refresh_journal.fingerprint(bike, DIRECT_URLS.get(bike['id']), MANUAL_QUERIES.get(bike['id']))
+
+def needs_download(bike, entry, fp, journal, force=False):
+    """
+    Incremental mode: a bike is skipped when its fingerprint matches the last successful
+    journal entry, that image is still on disk and it is not stale yet; a failed bike waits
+    out its backoff. Journaled results that never made it into bikes.json (interrupted run)
+    are applied here.
+    Returns (reason to refresh or None, record modified).
+    """
+    if force:
+        return 'force', False
+
+    if entry and entry['fingerprint'] == fp:
+        if entry['status'] == 'ok':
+            path = os.path.join(IMAGE_DIR, entry['image'])
+            if not (os.path.exists(path) and os.path.getsize(path) == entry['size']):
+                return 'missing', False
+            modified = apply_image(bike, entry['image'])
+            reason = refresh_scheduler.due(entry)
+            if not reason:
+                print(f"Skipping {bike['id']} (OK)")
+            return reason, modified
+        reason = refresh_scheduler.due(entry)
+        if not reason:
+            retry = time.strftime('%Y-%m-%d %H:%M', time.localtime(refresh_scheduler.retry_at(entry)))
+            print(f"Skipping {bike['id']} ({entry.get('failures', 1)} failures, backing off until {retry})")
+        return reason, False
+
+    if entry is None:
+        # First run with a journal: adopt images that are already in place
+        filename, size = local_image(bike)
+        if filename:
+            journal.record(bike['id'], fp, 'ok', filename, size, strategy='existing',
+                           **refresh_scheduler.history(None, 'ok', 'existing'))
+            print(f"Skipping {bike['id']} (OK)")
+            return None, False
+        return 'new', False
+    return 'changed', False
+
+def record_result(catalog, journal, bike, fp, local, strategy, winners, entry=None, deferred=False):
+    if local:
+        if apply_image(bike, local):
+            catalog.save(bike)
+        size = os.path.getsize(os.path.join(IMAGE_DIR, local))
+        journal.record(bike['id'], fp, 'ok', local, size, strategy=strategy,
+                       **refresh_scheduler.history(entry, 'ok', strategy))
+        winners[strategy] = winners.get(strategy, 0) + 1
+        instrumentation.METRICS.count('bike_outcomes', strategy=strategy, result='ok')
+    else:
+        status = 'deferred' if deferred else 'failed'
+        journal.record(bike['id'], fp, status, strategy=strategy,
+                       **refresh_scheduler.history(entry, status, strategy))
+        instrumentation.METRICS.count('bike_outcomes', strategy=strategy or 'none', result=status)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download side-profile images for every bike in bikes.json.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of bikes processed concurrently (1 = serial mode).")
+    parser.add_argument("--max-image-mb", type=float, default=None,
+                        help="Reject images larger than this many megabytes.")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-download every bike instead of only new or changed ones.")
+    parser.add_argument("--budget", type=int, default=None,
+                        help="Stop starting new bikes once this many network requests were made.")
+    parser.add_argument("--plan", action="store_true",
+                        help="Print this run's work queue and exit.")
+    parser.add_argument("--postprocess", action="store_true",
+                        help="Validate the images and build WebP/thumbnail variants afterwards (needs Pillow).")
+    parser.add_argument("--metrics", default=None,
+                        help="Write a run report here (JSON, or Prometheus text for a .prom file).")
+    parser.add_argument("--profile", choices=["cpu", "mem", "all"], default=None,
+                        help="Profile the run with cProfile and/or tracemalloc.")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    with instrumentation.profile(args.profile, 'download_images.prof'):
+        run(args)
+    for line in instrumentation.METRICS.summary():
+        print(line)
+    if args.metrics:
+        instrumentation.METRICS.write(args.metrics)
+        print(f"Run report written to {args.metrics}")
+
+def run(args):
+    global MAX_IMAGE_BYTES
+    if args.max_image_mb:
+        MAX_IMAGE_BYTES = int(args.max_image_mb * 1024 * 1024)
     setup_directories()
     try:
-        with open(JSON_PATH, 'r') as f: bikes = json.load(f)
+        # Sharded NDJSON catalog when imported (catalog_store.py), else the legacy bikes.json
+        catalog = catalog_store.open_catalog(JSON_PATH)
     except json.JSONDecodeError as e:
         print(f"CRITICAL: invalid JSON file. {e}")
         return
 
+    journal = refresh_journal.RefreshJournal()
+    state = journal.load()
+    fingerprints = {}
+    candidates, resumed, total = [], [], 0
+    for bike in catalog:
+        total += 1
+        fingerprints[bike['id']] = bike_fingerprint(bike)
+        entry = state.get(bike['id'])
+        reason, modified = needs_download(bike, entry, fingerprints[bike['id']], journal, args.force)
+        if reason:
+            candidates.append((bike, reason, entry))
+        if modified:
+            resumed.append(bike)
+    for bike in resumed:
+        catalog.save(bike)
+    queue = refresh_scheduler.plan(candidates)
+    reasons = {}
+    for _, reason, _ in queue:
+        reasons[reason] = reasons.get(reason, 0) + 1
+    print(f"{len(queue)} of {total} bikes need a refresh"
+          + (f" ({', '.join(f'{n} {r}' for r, n in reasons.items())})." if reasons else "."))
+    if args.plan:
+        for bike, reason, entry in queue:
+            print(f"  {bike['id']:<8} {reason:<8} {bike['brand']} {bike['model']}"
+                  + (f"  (last winner: {entry['winner']})" if entry and entry.get('winner') else ""))
+        return
+
+    budget = refresh_scheduler.RunBudget(args.budget)
     count = 0
-    for bike in bikes:
-        # Check Local Existence
-        current_image = bike['builds'][0]['images'][0]
-        is_local_ref = not current_image.startswith("http")
-        file_exists = False
-        
-        if is_local_ref:
-            possible_path = os.path.join(IMAGE_DIR, current_image)
-            if os.path.exists(possible_path) and os.path.getsize(possible_path) > 3000:
-                file_exists = True
-        
-        if not FORCE_DOWNLOAD and file_exists:
-            print(f"Skipping {bike['id']} (OK)")
-            continue
-            
-        print(f"\nProcessing [{bike['id']}] {bike['brand']} {bike['model']}...")
-        img_url = None
-        
-        # DIRECT URL OVERRIDES (Stubborn bikes)
-        DIRECT_URLS = {
-            "b2": "https://www.canyon.com/dw/image/v2/BCML_PRD/on/demandware.static/-/Sites-canyon-master/default/dw8e82755e/images/full/full_2024_/2024_/full_2024_Aeroad-CFR-Di2_3943_P04_P5.png?sw=1000&sh=1000&sm=fit&sfrm=png",
-            "b4": "https://www.reveduvelo.com/2645-large_default/pinarello-dogma-f-dura-ace-di2-luxter-blue-2025-road-bike.jpg",
-            "b5": "https://www.cannondale.com/-/media/images/product-images/supersix-evo/lab71-team/team/c23_c11082u_supersix_evo_lab71_team_team_3.ashx",
-            "b8": "https://cdn.road.cc/sites/default/files/2024%20Orbea%20Orca%20Aero%20M10i%20LTD%20-%202.jpg",
-            "b9": "https://bikeinsights.com/images/bikes/640f1a4a4f8b9e001dfa84b1.jpg",
-            "b15": "https://www.vitoriabikes.es/wp-content/uploads/2023/10/Nyxtralight-Electric-Blue-1.jpg"
-        }
-
-        # 1. Try Direct URL first
-        if bike['id'] in DIRECT_URLS:
-            print(f"  [Direct URL Access] {bike['id']}")
-            img_url = DIRECT_URLS[bike['id']]
-
-        # 2. Hardcoded Manual Queries for remaining cases
-        MANUAL_QUERIES = {
-            "b2": "Canyon Aeroad CFR side profile 2024",
-            "b4": "Pinarello Dogma F 2025 side view",
-            "b5": "Cannondale SuperSix EVO LAB71 side view",
-            "b8": "Orbea Orca Aero 2024 side profile",
-            "b9": "Scott Foil RC 2024 side view",
-            "b15": "Vitoria Nyxtralight road bike side view",
-        }
-
-        # Custom Override: S-Works
-        if not img_url and bike['id'] == 'b1':
-            print("  [Override] Searching for full bike with wheels...")
-            img_url = search_image("Specialized S-Works Tarmac SL8 Dura Ace Di2 side view full bike png", transparent=True)
-            
-        # Manual Query Override
-        if not img_url and bike['id'] in MANUAL_QUERIES:
-             print(f"  [Manual Override] {bike['id']}")
-             # Try transparent first
-             img_url = search_image(MANUAL_QUERIES[bike['id']], transparent=True)
-             # If fail, try normal
-             if not img_url:
-                 img_url = search_image(MANUAL_QUERIES[bike['id']], transparent=False)
-            
-        # STRATEGY 1: Transparent Search (Specific)
-        if not img_url:
-            q = f"{bike['brand']} {bike['model']} {bike['year']} side profile"
-            img_url = search_image(q, transparent=True)
-            
-        # STRATEGY 2: Transparent Search (Generic)
-        if not img_url:
-            q = f"{bike['brand']} {bike['model']} road bike"
-            img_url = search_image(q, transparent=True)
-        
-        # STRATEGY 3: Normal Search (Detailed) - If transparent fails
-        if not img_url:
-            print("    [Warn] No transparent image found. Trying normal search...")
-            q = f"{bike['brand']} {bike['model']} side view"
-            img_url = search_image(q, transparent=False)
-            
-        # STRATEGY 4: Official Site Metadata (Last resort)
-        if not img_url:
-            img_url = get_og_image(bike.get('official_url'))
-
-        # DOWNLOAD
-        if img_url:
-            local = download_image(img_url, bike['id'])
-            if local:
-                # Update JSON in memory
-                count += 1
-                for b in bike['builds']:
-                    if b['images']: b['images'][0] = local
-                    else: b['images'] = [local]
-            else:
-                print("    [Error] Found info but failed to download/save valid image.")
+    winners = {}
+    started = 0
+    try:
+        if args.workers <= 1:
+            for bike, reason, entry in queue:
+                if not budget.allows():
+                    break
+                started += 1
+                local, strategy, deferred = process_bike(bike, (entry or {}).get('winner'),
+                                                         reason in REVALIDATE_REASONS)
+                record_result(catalog, journal, bike, fingerprints[bike['id']], local, strategy, winners,
+                              entry, deferred)
+                if local:
+                    count += 1
         else:
-            print("    [Fail] No image found after all attempts.")
-            
-        time.sleep(4) # Increased delay to avoid blocks
-        
-    with open(JSON_PATH, 'w') as f: json.dump(bikes, f, indent=4)
+            # Worker pool mode: politeness comes from the per-host caps and rate control in http_client,
+            # results are applied to the catalog from this thread only. Bikes are submitted as
+            # workers free up, in queue order, so the budget check sees the requests made so far.
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                pending = iter(queue)
+                futures = {}
+
+                def fill():
+                    nonlocal started
+                    while len(futures) < args.workers and budget.allows():
+                        item = next(pending, None)
+                        if item is None:
+                            return
+                        bike, reason, entry = item
+                        futures[pool.submit(process_bike, bike, (entry or {}).get('winner'),
+                                            reason in REVALIDATE_REASONS)] = item
+                        started += 1
+
+                try:
+                    fill()
+                    while futures:
+                        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            bike, _, entry = futures.pop(future)
+                            try:
+                                local, strategy, deferred = future.result()
+                            except Exception as e:
+                                print(f"    [Error] {bike['id']} crashed: {e}")
+                                continue
+                            record_result(catalog, journal, bike, fingerprints[bike['id']], local, strategy,
+                                          winners, entry, deferred)
+                            if local:
+                                count += 1
+                        fill()
+                except KeyboardInterrupt:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+    except KeyboardInterrupt:
+        print("\nInterrupted. Progress is kept in the journal; re-run to resume.")
+    if started < len(queue) and not budget.allows():
+        print(f"\nRequest budget reached ({budget.spent()} requests): {len(queue) - started} bikes left for the next run.")
+
+    catalog.commit()
+    image_store.get_store().save()
+    journal.compact()
     print(f"\nCompleted. Updated {count} bikes.")
+    if args.postprocess:
+        import image_pipeline
+        manifest, processed = image_pipeline.run(['BikeImages'])
+        rejected = sorted(k for k, v in manifest.items() if v['status'] == 'rejected')
+        print(f"Post-processed {processed} images; rejected: {', '.join(rejected) or 'none'}")
+    if winners:
+        print("Winning strategies: " + ", ".join(f"{name}={n}" for name, n in sorted(winners.items(), key=lambda kv: -kv[1])))
+    for host, info in sorted(http_client.RATE_CONTROLLER.snapshot().items()):
+        print(f"  {host}: {info['requests']} requests, {info['throttled']} throttled, "
+              f"final rate {info['rate']}/s{' [circuit open]' if info['circuit_open'] else ''}")
 
 if __name__ == "__main__":
     main()
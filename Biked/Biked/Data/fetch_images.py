@@ -1,102 +1,215 @@
-import json
-import requests
-import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import catalog_store
+import http_client
+import instrumentation
+import search_cache
+
 # File paths
 BASE_DIR = Path(__file__).resolve().parent
 JSON_FILE = BASE_DIR / "bikes.json"
 
-def search_wikimedia(query, limit=3):
-    """Searches Wikimedia Commons for images."""
-    url = "https://commons.wikimedia.org/w/api.php"
-    params = {
-        "action": "query",
-        "generator": "search",
-        "gsrnamespace": "6", # File namespace
-        "gsrsearch": query,
-        "gsrlimit": limit,
-        "prop": "imageinfo",
-        "iiprop": "url",
-        "format": "json"
-    }
-    
-    headers = {
-        "User-Agent": "BikeGeometryFinder/1.0 (https://github.com/gtrujillovdev-cyber/Biked; gabriel@example.com)"
-    }
-    
+API_URL = "https://commons.wikimedia.org/w/api.php"
+
+# Lookups are split in two: a cheap list=search per query returns file titles only, then
+# the image URLs for every title found are fetched with prop=imageinfo, up to 50 titles
+# per call. iiurlwidth asks Commons for a thumbnail at the width the app displays
+# (full-width detail image at 3x) instead of the multi-megabyte original.
+THUMB_WIDTH = 1200
+TITLES_PER_CALL = 50     # API maximum for anonymous clients
+LOOKUP_WORKERS = 4       # Concurrent bike lookups (the client also caps requests per host)
+REQUEST_BUDGET = 200     # Max API requests per run; cached answers are free
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+class BudgetExhausted(Exception):
+    pass
+
+class RequestBudget:
+    """Thread-safe count of the API requests a run may still make."""
+    def __init__(self, limit=REQUEST_BUDGET):
+        self.remaining = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def spend(self):
+        with self._lock:
+            if self.remaining <= 0:
+                raise BudgetExhausted("Wikimedia request budget exhausted")
+            self.remaining -= 1
+            self.used += 1
+
+_budget = RequestBudget()
+
+def _api(params):
+    _budget.spend()
+    params = dict(params, action="query", format="json")
+    response = http_client.get(API_URL, params=params, headers=http_client.API_HEADERS, timeout=10, cache=True)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return response.json()
+
+def query_titles(query, limit):
+    """File titles matching a Commons search; raises on HTTP errors so they are never cached."""
+    data = _api({
+        "list": "search",
+        "srnamespace": "6",  # File namespace
+        "srsearch": query,
+        "srlimit": limit,
+        "srprop": "",
+    })
+    titles = [hit["title"] for hit in data.get("query", {}).get("search", [])]
+    # Filter for typical image extensions to avoid PDFs, etc.
+    return [t for t in titles if t.lower().endswith(IMAGE_EXTENSIONS)]
+
+@instrumentation.timed('wikimedia_search')
+def search_titles(query, limit=3):
+    """Cached title search; errors (and an exhausted budget) return []."""
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        
-        if response.status_code != 200:
-             print(f"Error: HTTP {response.status_code}")
-             return []
-             
-        data = response.json()
-        
-        image_urls = []
-        if "query" in data and "pages" in data["query"]:
-            for page_id, page_data in data["query"]["pages"].items():
-                if "imageinfo" in page_data:
-                    image_url = page_data["imageinfo"][0]["url"]
-                    # Filter for typical image extensions to avoid PDFs, etc.
-                    if image_url.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
-                        image_urls.append(image_url)
-        
-        return image_urls
+        return search_cache.get_cache().cached(
+            'wikimedia', query, lambda: query_titles(query, limit), filters=f"titles,limit={limit}")
     except Exception as e:
         print(f"Error searching for {query}: {e}")
         return []
 
+def query_image_info(titles, width=THUMB_WIDTH):
+    """{title: thumbnail url} for up to TITLES_PER_CALL titles in a single request."""
+    data = _api({
+        "titles": "|".join(titles),
+        "prop": "imageinfo",
+        "iiprop": "url|mime",
+        "iiurlwidth": width,
+    })
+    query = data.get("query", {})
+    # Titles come back normalized ("File:A_b.jpg" -> "File:A b.jpg")
+    aliases = {n["to"]: n["from"] for n in query.get("normalized", [])}
+    urls = {}
+    for page in query.get("pages", {}).values():
+        info = (page.get("imageinfo") or [{}])[0]
+        url = info.get("thumburl") or info.get("url")
+        if url and info.get("mime", "image/").startswith("image/"):
+            urls[aliases.get(page["title"], page["title"])] = url
+    return urls
+
+@instrumentation.timed('wikimedia_imageinfo')
+def image_urls(titles, width=THUMB_WIDTH, pool=None):
+    """
+    {title: url} for many titles: cached titles cost nothing, the rest are fetched
+    TITLES_PER_CALL at a time (batches run concurrently on pool).
+    """
+    cache = search_cache.get_cache()
+    found, missing = {}, []
+    for title in dict.fromkeys(titles):
+        hit, url = cache.get('wikimedia-info', title, filters=f"w={width}")
+        if hit:
+            if url:
+                found[title] = url
+        else:
+            missing.append(title)
+
+    def fetch(batch):
+        try:
+            urls = query_image_info(batch, width)
+        except Exception as e:
+            print(f"Error fetching image info for {len(batch)} titles: {e}")
+            return {}
+        for title in batch:
+            cache.put('wikimedia-info', title, urls.get(title), filters=f"w={width}")
+        return urls
+
+    batches = [missing[i:i + TITLES_PER_CALL] for i in range(0, len(missing), TITLES_PER_CALL)]
+    for urls in (pool.map(fetch, batches) if pool else map(fetch, batches)):
+        found.update(urls)
+    return found
+
+@instrumentation.timed('search_wikimedia')
+def search_wikimedia(query, limit=3):
+    """Searches Wikimedia Commons for images (thumbnail URLs, results cached in search_cache)."""
+    titles = search_titles(query, limit)
+    urls = image_urls(titles)
+    return [urls[t] for t in titles if t in urls]
+
+def bike_queries(bike):
+    brand = bike.get("brand", "")
+    model = bike.get("model", "")
+    # Exact model first, then simpler fallbacks
+    return [f"{brand} {model}", model, f"{brand} bicycle"]
+
+@instrumentation.timed('bike')
+def lookup_titles(bike, limit=5):
+    """Titles of the first query (in fallback order) that finds anything."""
+    for query in bike_queries(bike):
+        titles = search_titles(query, limit)
+        if titles:
+            return titles
+    return []
+
 def update_bikes_with_images():
     if not JSON_FILE.exists():
         print("bikes.json not found!")
         return
 
-    with open(JSON_FILE, "r") as f:
-        bikes = json.load(f)
+    # Sharded NDJSON catalog when imported (catalog_store.py), else the legacy bikes.json
+    catalog = catalog_store.open_catalog(str(JSON_FILE))
     
+    bikes = list(catalog)
     updated_count = 0
-    
+    changed = []
+
+    with ThreadPoolExecutor(max_workers=LOOKUP_WORKERS, thread_name_prefix='wikimedia') as pool:
+        # 1. One title search per bike (plus fallbacks), bikes in parallel
+        titles_by_bike = dict(zip((b["id"] for b in bikes), pool.map(lookup_titles, bikes)))
+        # 2. Image URLs for every title found, 50 titles per request
+        urls = image_urls([t for titles in titles_by_bike.values() for t in titles], pool=pool)
+
     for bike in bikes:
-        brand = bike.get("brand", "")
-        model = bike.get("model", "")
-        full_name = f"{brand} {model}"
-        
-        print(f"Searching images for: {full_name}...")
-        
-        # Search for the bike model
-        # Improving query for better matches
-        images = search_wikimedia(f"{brand} {model}", limit=5)
-        
-        if not images:
-             # Fallback: simpler query
-             print(f"  No exact match, trying simpler query: {model}")
-             images = search_wikimedia(model, limit=5)
-             
-        if not images:
-            # Fallback: Just brand
-             print(f"  No match, trying brand: {brand} bike")
-             images = search_wikimedia(f"{brand} bicycle", limit=5)
+        full_name = f"{bike.get('brand', '')} {bike.get('model', '')}"
+        images = [urls[t] for t in titles_by_bike[bike["id"]] if t in urls]
 
         if images:
-            print(f"  Found {len(images)} images.")
+            print(f"  {full_name}: found {len(images)} images.")
             
             # Update each build with these images (rotating them if we have enough)
+            modified = False
             for i, build in enumerate(bike.get("builds", [])):
                 # Assign up to 3 images to each build, effectively using what we found
                 # If we have multiple builds, we might want to vary them, but for now reuse
-                build["images"] = images[:3] 
+                if build.get("images") != images[:3]:
+                    build["images"] = images[:3]
+                    modified = True
             
+            if modified:
+                changed.append(bike)
             updated_count += 1
         else:
             print(f"  No images found for {full_name}.")
 
-    # Save updated JSON
-    with open(JSON_FILE, "w") as f:
-        json.dump(bikes, f, indent=4)
+    # Save only the records that changed (one rewrite per shard in the sharded catalog),
+    # then write bikes.json atomically
+    if changed:
+        catalog.save_many(changed)
+        catalog.commit()
     
-    print(f"\nUpdated {updated_count} bikes with new images.")
+    print(f"\nUpdated {updated_count} bikes with new images ({_budget.used} API requests).")
+
+def main():
+    global _budget
+    parser = argparse.ArgumentParser(description="Attach Wikimedia Commons images to every build in bikes.json.")
+    parser.add_argument("--budget", type=int, default=REQUEST_BUDGET, help="Max Wikimedia API requests this run.")
+    parser.add_argument("--metrics", default=None,
+                        help="Write a run report here (JSON, or Prometheus text for a .prom file).")
+    parser.add_argument("--profile", choices=["cpu", "mem", "all"], default=None,
+                        help="Profile the run with cProfile and/or tracemalloc.")
+    args = parser.parse_args()
+    _budget = RequestBudget(args.budget)
+    with instrumentation.profile(args.profile, 'fetch_images.prof'):
+        update_bikes_with_images()
+    for line in instrumentation.METRICS.summary():
+        print(line)
+    if args.metrics:
+        instrumentation.METRICS.write(args.metrics)
 
 if __name__ == "__main__":
-    update_bikes_with_images()
+    main()
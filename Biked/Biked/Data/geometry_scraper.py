@@ -0,0 +1,220 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from bs4 import BeautifulSoup
+
+import catalog_store
+import http_client
+import instrumentation
+import page_meta
+
+# Geometry ingestion from the brands' product pages.
+# Every bike's official_url is fetched concurrently (the shared HTTP client keeps the
+# per-host caps and rate control), and the raw HTML is kept in Data/.page_cache so a
+# re-parse never hits the network. Parsing with BeautifulSoup is CPU-bound, so pages go to
+# a process pool as soon as they arrive. The geometry table is located by its stack and
+# reach rows, in either orientation (sizes as columns or as rows), and its values are
+# written straight into the catalog's geometry entries.
+
+PAGE_DIR = os.path.join(catalog_store.DATA_DIR, '.page_cache')
+PAGE_TTL = 7 * 24 * 3600     # Cached pages younger than this are parsed without a request
+FETCH_WORKERS = 16
+PAGE_TIMEOUT = (5, 20)
+
+# Row label patterns -> catalog geometry keys (first match wins, so angles come first)
+FIELDS = [
+    ('seat_tube_angle', re.compile(r'seat\s*(tube\s*)?angle|sitzwinkel|sitzrohrwinkel', re.I)),
+    ('head_tube_angle', re.compile(r'head\s*(tube\s*)?angle|lenkwinkel|steuerrohrwinkel', re.I)),
+    ('stack_mm', re.compile(r'\bstack\b', re.I)),
+    ('reach_mm', re.compile(r'\breach\b', re.I)),
+    ('top_tube_mm', re.compile(r'(effective|horizontal|virtual)?\s*top\s*tube|oberrohr', re.I)),
+    ('seat_tube_mm', re.compile(r'seat\s*tube|sitzrohr', re.I)),
+]
+SIZE_LABEL = re.compile(r'^\s*(frame\s*)?size|^\s*gr(ö|oe)(ß|ss)e|^\s*talla', re.I)
+NUMBER = re.compile(r'-?\d+(?:[.,]\d+)?')
+
+def page_path(url):
+    return os.path.join(PAGE_DIR, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.html')
+
+def _decode(data, content_type):
+    return data.decode(page_meta.html_charset(content_type, data), errors='replace')
+
+@instrumentation.timed('fetch_page')
+def fetch_page(url, max_age=PAGE_TTL):
+    """
+    HTML of url, from the page cache while it is fresh. Raises on HTTP errors.
+    The raw bytes are cached with the response's Content-Type, so a cached page decodes
+    exactly like the fresh one did.
+    """
+    path = page_path(url)
+    meta_path = path[:-len('.html')] + '.json'
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < max_age:
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            with open(meta_path, 'r') as f:
+                content_type = json.load(f).get('content_type')
+        except (OSError, ValueError):
+            content_type = None
+        return _decode(data, content_type), True
+    response = http_client.get(url, timeout=PAGE_TIMEOUT)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    content_type = response.headers.get('Content-Type')
+    http_client.write_atomic(meta_path, json.dumps({'url': url, 'content_type': content_type}).encode('utf-8'))
+    http_client.write_atomic(path, response.content)
+    return _decode(response.content, content_type), False
+
+def _field(label):
+    for key, pattern in FIELDS:
+        if pattern.search(label):
+            return key
+    return None
+
+def _value(text, key):
+    """Number in a cell, in mm (or degrees for angles); None when the cell has none."""
+    match = NUMBER.search(text.replace('−', '-'))
+    if not match:
+        return None
+    value = float(match.group().replace(',', '.'))
+    if key.endswith('_mm') and ('cm' in text.lower() or value < 100):
+        value *= 10  # Tables given in centimetres
+    value = round(value, 2)
+    return int(value) if value.is_integer() else value
+
+def _rows(table):
+    rows = []
+    for tr in table.find_all('tr'):
+        cells = [c.get_text(' ', strip=True) for c in tr.find_all(['th', 'td'])]
+        if any(cells):
+            rows.append(cells)
+    return rows
+
+def _from_columns(rows):
+    """Sizes across the top, one geometry measure per row (the usual brand layout)."""
+    header = next((r for r in rows if r and SIZE_LABEL.search(r[0])), rows[0])
+    sizes = header[1:]
+    entries = [{'size': s} for s in sizes]
+    for row in rows:
+        key = _field(row[0]) if row else None
+        if not key or row is header:
+            continue
+        for entry, cell in zip(entries, row[1:]):
+            if key not in entry:
+                entry[key] = _value(cell, key)
+    return entries
+
+def _from_rows(rows):
+    """One size per row, measures as columns."""
+    header = rows[0]
+    keys = [_field(label) for label in header]
+    entries = []
+    for row in rows[1:]:
+        entry = {'size': row[0]}
+        for key, cell in zip(keys[1:], row[1:]):
+            if key and key not in entry:
+                entry[key] = _value(cell, key)
+        entries.append(entry)
+    return entries
+
+def parse_geometry(html):
+    """
+    Geometry entries (catalog keys) from the first table that has both stack and reach.
+    Sizes without a stack or reach value are dropped.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    for table in soup.find_all('table'):
+        rows = _rows(table)
+        if len(rows) < 2:
+            continue
+        row_labels = {_field(r[0]) for r in rows}
+        column_labels = {_field(label) for label in rows[0]}
+        if {'stack_mm', 'reach_mm'} <= row_labels:
+            entries = _from_columns(rows)
+        elif {'stack_mm', 'reach_mm'} <= column_labels:
+            entries = _from_rows(rows)
+        else:
+            continue
+        geometry = []
+        for entry in entries:
+            if entry.get('size') and entry.get('stack_mm') and entry.get('reach_mm'):
+                geometry.append({key: entry.get(key) for key in
+                                 ('size', 'stack_mm', 'reach_mm', 'top_tube_mm', 'seat_tube_mm')})
+                for key in ('seat_tube_angle', 'head_tube_angle'):
+                    if entry.get(key) is not None:
+                        geometry[-1][key] = entry[key]
+        if geometry:
+            return geometry
+    return []
+
+def _parse_task(args):
+    bike_id, html = args
+    return bike_id, parse_geometry(html)
+
+def scrape(bikes, workers=None, fetch_workers=FETCH_WORKERS, max_age=PAGE_TTL):
+    """
+    Yields (bike, geometry or None, error) for every bike with an official_url.
+    Fetches run on threads; each page is handed to the parser pool as soon as it arrives.
+    """
+    bikes = [b for b in bikes if b.get('official_url')]
+    by_id = {b['id']: b for b in bikes}
+    with ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='page') as fetchers, \
+            ProcessPoolExecutor(max_workers=workers) as parsers:
+        fetches = {fetchers.submit(fetch_page, b['official_url'], max_age): b['id'] for b in bikes}
+        parses = []
+        for future in as_completed(fetches):
+            bike_id = fetches[future]
+            try:
+                html, _ = future.result()
+            except Exception as e:
+                yield by_id[bike_id], None, str(e)
+                continue
+            parses.append(parsers.submit(_parse_task, (bike_id, html)))
+        for future in as_completed(parses):
+            try:
+                bike_id, geometry = future.result()
+            except Exception as e:
+                yield None, None, str(e)
+                continue
+            yield by_id[bike_id], geometry, None
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape frame geometry tables from each bike's official_url.")
+    parser.add_argument("--bikes", nargs="*", help="Only these bike ids.")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: all cores).")
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS, help="Concurrent page downloads.")
+    parser.add_argument("--refetch", action="store_true", help="Ignore the page cache age.")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without saving.")
+    parser.add_argument("--metrics", default=None,
+                        help="Write a run report here (JSON, or Prometheus text for a .prom file).")
+    args = parser.parse_args()
+
+    catalog = catalog_store.open_catalog()
+    bikes = [b for b in catalog if not args.bikes or b['id'] in args.bikes]
+    changed, failed, empty = [], 0, 0
+    for bike, geometry, error in scrape(bikes, args.workers, args.fetch_workers, 0 if args.refetch else PAGE_TTL):
+        if error:
+            failed += 1
+            print(f"   [Error] {bike['id'] if bike else '?'}: {error}")
+        elif not geometry:
+            empty += 1
+            print(f"   [No table] {bike['id']} ({bike['official_url']})")
+        elif geometry != bike.get('geometry'):
+            print(f"   [Updated] {bike['id']}: {len(geometry)} sizes")
+            bike['geometry'] = geometry
+            changed.append(bike)
+
+    if changed and not args.dry_run:
+        catalog.save_many(changed)
+        catalog.commit()
+    print(f"\nCompleted. {len(changed)} bikes updated, {empty} without a geometry table, {failed} failed.")
+    if args.metrics:
+        instrumentation.METRICS.write(args.metrics)
+
+if __name__ == "__main__":
+    main()
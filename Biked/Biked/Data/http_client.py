@@ -0,0 +1,348 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation
+import rate_control
+
+# Shared HTTP layer for the data scripts (download_images.py, fetch_images.py, scraper.py).
+# One keep-alive session with a connection pool per host, a retry policy,
+# default timeouts and an on-disk cache revalidated with ETag / Last-Modified.
+
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+API_HEADERS = {
+    "User-Agent": "BikeGeometryFinder/1.0 (https://github.com/gtrujillovdev-cyber/Biked; gabriel@example.com)"
+}
+
+DEFAULT_TIMEOUT = (5, 15) # (connect, read) seconds
+POOL_CONNECTIONS = 16     # Number of hosts kept in the pool
+POOL_MAXSIZE = 8          # Keep-alive connections per host
+
+RETRY_POLICY = Retry(
+    total=3,
+    connect=3,
+    read=2,
+    backoff_factor=0.5,
+    status_forcelist=(500, 502, 504), # 429/503 are handled by the rate controller
+    allowed_methods=frozenset(['GET', 'HEAD']),
+    raise_on_status=False,
+)
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.http_cache')
+
+# Per-host concurrency caps.
+# Search engines are capped individually, every brand site / CDN gets DEFAULT_HOST_LIMIT.
+HOST_LIMITS = {
+    'bing': 2,
+    'duckduckgo': 2,
+    'wikimedia': 4,
+}
+DEFAULT_HOST_LIMIT = 4
+
+# Adaptive per-host throttling (AIMD + Retry-After + circuit breaker)
+RATE_CONTROLLER = rate_control.RateController()
+
+# Base URL of a stand-in server that receives every request instead of the real hosts
+# (benchmark.py). The original URL is kept in the path: <override>/<scheme>/<host>/<path>.
+HOST_OVERRIDE = os.environ.get('BIKED_HTTP_OVERRIDE')
+
+_session = None
+_session_lock = threading.Lock()
+_host_semaphores = {}
+_host_lock = threading.Lock()
+
+def get_session():
+    """Returns the process-wide pooled session (created on first use)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                                  max_retries=RETRY_POLICY)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(BROWSER_HEADERS)
+            _session = session
+        return _session
+
+def host_key(url):
+    host = urlparse(url).netloc.lower()
+    for engine in HOST_LIMITS:
+        if engine in host:
+            return engine
+    return host
+
+@contextmanager
+def host_slot(url):
+    """Blocks until a concurrency slot for the URL's host is free."""
+    key = host_key(url)
+    with _host_lock:
+        if key not in _host_semaphores:
+            _host_semaphores[key] = threading.BoundedSemaphore(HOST_LIMITS.get(key, DEFAULT_HOST_LIMIT))
+        sem = _host_semaphores[key]
+    with sem:
+        yield
+
+def _route(url):
+    if not HOST_OVERRIDE:
+        return url
+    parts = urlparse(url)
+    routed = f"{HOST_OVERRIDE.rstrip('/')}/{parts.scheme}/{parts.netloc}{parts.path or '/'}"
+    return f"{routed}?{parts.query}" if parts.query else routed
+
+def _send(url, **kwargs):
+    """Single GET through the session, paced and fed back to the host's rate controller."""
+    host = host_key(url)
+    RATE_CONTROLLER.acquire(host)
+    start = time.perf_counter()
+    try:
+        response = get_session().get(_route(url), **kwargs)
+    except requests.RequestException as e:
+        RATE_CONTROLLER.record_error(host)
+        # A request that gave up after exhausting its retries made every one of them
+        retries = RETRY_POLICY.total if isinstance(e, (requests.ConnectionError, requests.exceptions.RetryError)) else 0
+        instrumentation.observe_request(host, time.perf_counter() - start, 'error', retries=retries)
+        raise
+    RATE_CONTROLLER.record(host, response.status_code, response.headers.get('Retry-After'))
+    # Streamed bodies are counted by whoever reads them, through record_bytes
+    size = None if kwargs.get('stream') else len(response.content)
+    retries = getattr(response.raw, 'retries', None)
+    instrumentation.observe_request(host, time.perf_counter() - start, response.status_code, size,
+                                    len(retries.history) if retries else 0)
+    return response
+
+def record_bytes(url, size):
+    """Adds the body bytes read from a streamed response to the run's byte counters."""
+    if size:
+        instrumentation.METRICS.count('bytes', size, host=host_key(url))
+
+def get(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT, stream=False, cache=False):
+    """
+    GET through the shared session, holding a host slot for the duration of the request.
+    With cache=True the body is kept on disk and revalidated with If-None-Match /
+    If-Modified-Since; a 304 is turned back into a 200 carrying the cached body.
+    """
+    if cache:
+        return _cached_get(url, params, headers, timeout)
+    with host_slot(url):
+        return _send(url, params=params, headers=headers, timeout=timeout, stream=stream)
+
+# --- On-disk HTTP cache ---
+
+_cache_lock = threading.Lock()
+
+def _cache_key(url, params=None):
+    prepared = requests.Request('GET', url, params=params).prepare()
+    return hashlib.sha256(prepared.url.encode('utf-8')).hexdigest()
+
+def _meta_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + '.json')
+
+def _body_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + '.body')
+
+def _load_meta(key):
+    try:
+        with open(_meta_path(key), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_atomic(path, data):
+    """Writes bytes to path through a temp file and a rename (safe across threads and processes)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _store_meta(key, meta):
+    with _cache_lock:
+        write_atomic(_meta_path(key), json.dumps(meta).encode('utf-8'))
+
+def _validator_headers(meta):
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
+def _validators(response):
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'content_type': response.headers.get('Content-Type'),
+    }
+
+def _cached_get(url, params, headers, timeout):
+    key = _cache_key(url, params)
+    meta = _load_meta(key)
+    body_path = _body_path(key)
+    request_headers = dict(headers or {})
+    if meta and os.path.exists(body_path):
+        request_headers.update(_validator_headers(meta))
+
+    with host_slot(url):
+        response = _send(url, params=params, headers=request_headers, timeout=timeout)
+
+    if response.status_code == 304 and meta and os.path.exists(body_path):
+        instrumentation.METRICS.count('http_cache', result='revalidated')
+        with open(body_path, 'rb') as f:
+            response._content = f.read()
+        response.status_code = 200
+        response.from_cache = True
+        if meta.get('content_type'):
+            response.headers['Content-Type'] = meta['content_type']
+        return response
+
+    response.from_cache = False
+    instrumentation.METRICS.count('http_cache', result='miss')
+    if response.status_code == 200:
+        meta = _validators(response)
+        if meta['etag'] or meta['last_modified']:
+            with _cache_lock:
+                write_atomic(body_path, response.content)
+            _store_meta(key, meta)
+    return response
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _file_matches(meta):
+    """Whether the saved file still holds the body the validators were issued for."""
+    try:
+        st = os.stat(meta['path'])
+    except (KeyError, OSError):
+        return False
+    if st.st_size != meta.get('size') or not meta.get('sha256'):
+        return False
+    # Same size and mtime: untouched since it was written. Otherwise (relinked, rewritten) hash it
+    return st.st_mtime_ns == meta.get('mtime_ns') or _file_digest(meta['path']) == meta['sha256']
+
+def conditional_headers(url):
+    """
+    Validators for a URL whose body was saved to a local file by the caller.
+    Returns (headers, local_path); both are empty/None when the saved copy is gone or
+    has since been overwritten with other bytes (e.g. another URL downloaded to the same path).
+    """
+    meta = _load_meta(_cache_key(url))
+    if not meta or not _file_matches(meta):
+        return {}, None
+    return _validator_headers(meta), meta['path']
+
+def remember_file(url, response, path, digest=None):
+    """Stores the response validators for a body the caller wrote to path, with its SHA-256."""
+    meta = _validators(response)
+    if meta['etag'] or meta['last_modified']:
+        st = os.stat(path)
+        meta.update(path=os.path.abspath(path), size=st.st_size, mtime_ns=st.st_mtime_ns,
+                     sha256=digest or _file_digest(path))
+        _store_meta(_cache_key(url), meta)
+
+# --- Streaming downloads ---
+
+# Some CDNs serve images as generic binary
+IMAGE_CONTENT_TYPES = ('image/', 'application/octet-stream', 'binary/octet-stream')
+MAX_IMAGE_BYTES = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+class DownloadRejected(Exception):
+    """The response was refused before (or while) its body was pulled."""
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status  # HTTP status when the rejection was an error response
+
+def _copy_atomic(src, dest):
+    tmp = f"{dest}.{threading.get_ident()}.part"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+def download_file(url, dest, min_bytes=0, max_bytes=MAX_IMAGE_BYTES, content_types=IMAGE_CONTENT_TYPES,
+                  headers=None, timeout=DEFAULT_TIMEOUT, conditional=True):
+    """
+    Streams url to disk in chunks through a temp file next to the destination, then
+    renames it into place, so an existing file is only ever replaced by a complete one.
+    dest is a path or a callable taking the Content-Type and returning the path.
+    Responses are rejected from their headers (status, Content-Type, Content-Length)
+    before the body is read, and aborted as soon as they grow past max_bytes.
+    With conditional, a saved copy whose bytes still match is revalidated instead.
+    Returns (path, size, not_modified); raises DownloadRejected.
+    """
+    resolve = dest if callable(dest) else (lambda content_type: dest)
+    validators, cached_path = conditional_headers(url) if conditional else ({}, None)
+    request_headers = dict(headers or {})
+    request_headers.update(validators)
+
+    with host_slot(url):
+        with _send(url, headers=request_headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and cached_path:
+                meta = _load_meta(_cache_key(url)) or {}
+                if meta.get('path') != cached_path or not _file_matches(meta):
+                    # The saved copy changed while the request was out: fetch the body again
+                    response.close()
+                    return download_file(url, dest, min_bytes, max_bytes, content_types, headers, timeout,
+                                         conditional=False)
+                instrumentation.METRICS.count('http_cache', result='revalidated')
+                path = resolve((meta.get('content_type') or '').lower())
+                if os.path.abspath(path) != cached_path:
+                    _copy_atomic(cached_path, path)
+                return path, os.path.getsize(path), True
+
+            if response.status_code != 200:
+                raise DownloadRejected(f"HTTP {response.status_code}", response.status_code)
+
+            content_type = response.headers.get('Content-Type', '').lower()
+            if content_types and not content_type.startswith(content_types):
+                raise DownloadRejected(f"unexpected Content-Type '{content_type or 'none'}'")
+
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit():
+                if int(length) < min_bytes:
+                    raise DownloadRejected(f"too small ({length} bytes)")
+                if max_bytes and int(length) > max_bytes:
+                    raise DownloadRejected(f"too large ({length} bytes)")
+
+            path = resolve(content_type)
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.part')
+            size = 0
+            digest = hashlib.sha256()
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        size += len(chunk)
+                        if max_bytes and size > max_bytes:
+                            raise DownloadRejected(f"too large (> {max_bytes} bytes)")
+                        f.write(chunk)
+                        digest.update(chunk)
+                if size < min_bytes:
+                    raise DownloadRejected(f"too small ({size} bytes)")
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+            record_bytes(url, size)
+            remember_file(url, response, path, digest.hexdigest())
+            return path, size, False
@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+import catalog_store
+import image_store
+
+# Perceptual-hash audit of the image folders.
+# Byte-level dedup (image_store) misses re-encoded or resized copies of the same photo,
+# so every image gets a 256-bit pHash (16x16 low frequencies of a 64x64 DCT) and a
+# 256-bit dHash (horizontal gradient of a 17x16 greyscale). 64-bit hashes are too coarse
+# here: two different bikes cut out on white are often only 4-8 bits apart.
+# Hashes are packed into (n, 4) uint64 arrays and compared with vectorized XOR + popcount
+# in row blocks, which flags:
+#   - near-duplicates shared by different bikes (stock photos copied onto every build),
+#   - images that look like a known logo or placeholder.
+# Hashes are cached per file (size + mtime), so re-audits only decode new images.
+
+HASH_CACHE = os.path.join(image_store.DATA_DIR, '.image_hashes.json')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif')
+
+# Images that must never stand in for a bike photo
+REFERENCE_FILES = ('giant_logo.png', 'placeholder.png')
+
+HASH_SIZE = 16        # Hashes are HASH_SIZE x HASH_SIZE bits
+HASH_WORDS = HASH_SIZE * HASH_SIZE // 64
+# Max differing bits (of 256) to call two images the same picture. Resized or re-encoded
+# copies land within a few bits; different bikes on white backgrounds are 30+ bits apart.
+PHASH_THRESHOLD = 16
+DHASH_THRESHOLD = 16
+BLOCK_ELEMENTS = 4_000_000  # Hash pairs compared per step (~32 MB of uint64)
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+_DCT = _dct_matrix(HASH_SIZE * 4)
+
+def _pack(bits):
+    return np.packbits(bits.ravel()).view('>u8').astype(np.uint64)
+
+def _greyscale(img):
+    # Cut-outs: flatten transparent pixels onto white, otherwise their hidden RGB leaks in
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, img)
+    return img.convert('L')
+
+def dhash(grey):
+    a = np.asarray(grey.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    return _pack(a[:, 1:] > a[:, :-1])
+
+def phash(grey):
+    n = HASH_SIZE * 4
+    a = np.asarray(grey.resize((n, n), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ a @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    return _pack(low > np.median(low.ravel()[1:]))  # The DC term would skew the median
+
+def hash_file(path):
+    """(phash, dhash) uint64 word arrays of an image file, or None if it cannot be decoded."""
+    try:
+        with Image.open(path) as img:
+            img.draft('L', (256, 256))  # Lets JPEG decode at a reduced scale
+            grey = _greyscale(img)
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+        return None
+    return phash(grey), dhash(grey)
+
+if hasattr(np, 'bitwise_count'):
+    popcount = np.bitwise_count
+else:
+    def popcount(x):
+        """SWAR popcount of a uint64 array (NumPy < 2.0)."""
+        x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+        x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+def hamming(a, b):
+    """Bit distance between broadcastable (..., HASH_WORDS) uint64 hash arrays."""
+    return popcount(np.bitwise_xor(a, b)).sum(axis=-1, dtype=np.uint16)
+
+def near_pairs(phashes, dhashes, phash_threshold=PHASH_THRESHOLD, dhash_threshold=DHASH_THRESHOLD):
+    """
+    All index pairs (i < j) within both thresholds, with their pHash distance.
+    Compares one block of rows against the hashes after it at a time, so memory stays
+    bounded while the work is all NumPy. The first word is a cheap exact prefilter: a pair
+    whose first 64 bits already differ by more than the threshold cannot be within it.
+    """
+    n = len(phashes)
+    pairs_i, pairs_j, dist = [], [], []
+    first = np.ascontiguousarray(phashes[:, 0])
+    block = max(1, BLOCK_ELEMENTS // max(n, 1))
+    for start in range(0, n, block):
+        stop = min(n, start + block)
+        d0 = popcount(np.bitwise_xor(first[start:stop, None], first[None, start:]))
+        i, j = np.nonzero(d0 <= phash_threshold)
+        i, j = i + start, j + start
+        keep = j > i
+        i, j = i[keep], j[keep]
+        d = hamming(phashes[i], phashes[j])
+        keep = (d <= phash_threshold) & (hamming(dhashes[i], dhashes[j]) <= dhash_threshold)
+        pairs_i.append(i[keep])
+        pairs_j.append(j[keep])
+        dist.append(d[keep])
+    if not pairs_i:
+        empty = np.array([], dtype=np.intp)
+        return empty, empty, np.array([], dtype=np.uint16)
+    return np.concatenate(pairs_i), np.concatenate(pairs_j), np.concatenate(dist)
+
+def nearest_reference(phashes, ref_phashes, threshold=PHASH_THRESHOLD):
+    """(index of closest reference, distance) per image; index -1 when none is within threshold."""
+    if not len(ref_phashes) or not len(phashes):
+        return np.full(len(phashes), -1), np.full(len(phashes), HASH_SIZE * HASH_SIZE)
+    d = hamming(phashes[:, None, :], ref_phashes[None, :, :])
+    best = d.argmin(axis=1)
+    dist = d[np.arange(len(d)), best]
+    return np.where(dist <= threshold, best, -1), dist
+
+def _hash_task(path):
+    return path, hash_file(path)
+
+class HashIndex:
+    """pHash/dHash of every image, keyed like the image store ('<namespace>/<file>' or 'url:<url>')."""
+
+    def __init__(self, cache_path=HASH_CACHE):
+        self.cache_path = cache_path
+        self.cache = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r') as f:
+                self.cache = json.load(f)
+        self.keys, self.paths = [], []
+        self.phashes = self.dhashes = np.zeros((0, HASH_WORDS), dtype=np.uint64)
+
+    def build(self, files, workers=None):
+        """files: {key: path}. Decodes only files whose size/mtime changed since the last run."""
+        stats, todo = {}, []
+        for key, path in files.items():
+            st = os.stat(path)
+            stats[path] = [st.st_size, st.st_mtime_ns]
+            cached = self.cache.get(path)
+            stale = cached and cached[2] is not None and len(cached[2]) != HASH_WORDS * 16
+            if not cached or cached[:2] != stats[path] or stale:
+                todo.append(path)
+        if todo:
+            workers = min(workers or os.cpu_count() or 1, len(todo))
+            if workers == 1:
+                results = list(map(_hash_task, todo))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(_hash_task, todo, chunksize=max(1, len(todo) // (workers * 4))))
+            for path, hashes in results:
+                self.cache[path] = stats[path] + ([h.tobytes().hex() for h in hashes] if hashes else [None, None])
+            for path in [p for p in self.cache if not os.path.exists(p)]:
+                del self.cache[path]
+            catalog_store.write_json_atomic(self.cache_path, self.cache, indent=None)
+
+        self.keys, self.paths, ph, dh = [], [], [], []
+        for key, path in files.items():
+            entry = self.cache.get(path)
+            if entry and entry[2] is not None:
+                self.keys.append(key)
+                self.paths.append(path)
+                ph.append(entry[2])
+                dh.append(entry[3])
+        self.phashes = np.frombuffer(bytes.fromhex(''.join(ph)), dtype=np.uint64).reshape(-1, HASH_WORDS)
+        self.dhashes = np.frombuffer(bytes.fromhex(''.join(dh)), dtype=np.uint64).reshape(-1, HASH_WORDS)
+        return len(todo)
+
+def collect_files(catalog_path=catalog_store.JSON_PATH):
+    """
+    ({key: path}, {key: set of bike ids}) for every image in the app folders plus remote
+    build images that are already in the image store. A file no bike references is
+    attributed to its name (b4.webp -> b4) so leftovers still take part in the audit.
+    """
+    files, owners = {}, {}
+    for namespace, folder in image_store.EXPORT_DIRS.items():
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                files[f"{namespace}/{name}"] = os.path.join(folder, name)
+
+    store = image_store.get_store()
+    for bike in catalog_store.open_catalog(catalog_path):
+        for build in bike.get('builds', []):
+            for image in build.get('images', []):
+                if image.startswith('http'):
+                    known = store.find_url(image)
+                    if not known:
+                        continue
+                    key = f"url:{image}"
+                    files[key] = store.blob_path(known[0])
+                else:
+                    key = f"BikeImages/{image}"
+                owners.setdefault(key, set()).add(bike['id'])
+
+    for key in files:
+        if key not in owners:
+            owners[key] = {os.path.splitext(os.path.basename(key))[0]}
+    return files, owners
+
+def audit(catalog_path=catalog_store.JSON_PATH, workers=None):
+    files, owners = collect_files(catalog_path)
+    index = HashIndex()
+    decoded = index.build(files, workers)
+    names = [os.path.basename(k) for k in index.keys]
+    is_ref = np.array([n in REFERENCE_FILES for n in names], dtype=bool)
+
+    report = {'images': len(index.keys), 'decoded': decoded,
+              'undecodable': sorted(k for k in files if k not in set(index.keys)),
+              'duplicates': [], 'references': []}
+
+    i, j, dist = near_pairs(index.phashes, index.dhashes)
+    for a, b, d in zip(i, j, dist):
+        ka, kb = index.keys[a], index.keys[b]
+        if is_ref[a] or is_ref[b] or owners[ka] == owners[kb]:
+            continue  # Same bike in two formats is fine; reference matches are reported below
+        report['duplicates'].append({'a': ka, 'b': kb, 'distance': int(d),
+                                     'bikes': sorted(owners[ka] | owners[kb])})
+
+    ref_idx = np.flatnonzero(is_ref)
+    best, dist = nearest_reference(index.phashes[~is_ref], index.phashes[ref_idx])
+    for k, r, d in zip(np.flatnonzero(~is_ref), best, dist):
+        if r >= 0:
+            report['references'].append({'image': index.keys[k], 'matches': names[ref_idx[r]],
+                                         'distance': int(d), 'bikes': sorted(owners[index.keys[k]])})
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Find duplicate and wrong bike images with perceptual hashes.")
+    parser.add_argument("--workers", type=int, default=None, help="Processes used for hashing (default: all cores).")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    parser.add_argument("--catalog", default=catalog_store.JSON_PATH, help="Path to bikes.json.")
+    args = parser.parse_args()
+
+    report = audit(args.catalog, args.workers)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Hashed {report['images']} images ({report['decoded']} decoded this run).")
+    for key in report['undecodable']:
+        print(f"  [Undecodable] {key}")
+    for dup in report['duplicates']:
+        print(f"  [Duplicate] {dup['a']} ~ {dup['b']} ({dup['distance']} bits, bikes {', '.join(dup['bikes'])})")
+    for ref in report['references']:
+        print(f"  [Looks like {ref['matches']}] {ref['image']} ({ref['distance']} bits, bikes {', '.join(ref['bikes'])})")
+    if not report['duplicates'] and not report['references']:
+        print("No duplicates or logo/placeholder matches.")
+
+if __name__ == "__main__":
+    main()
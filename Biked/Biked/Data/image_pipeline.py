@@ -0,0 +1,188 @@
+import argparse
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+import catalog_store
+import http_client
+import image_store
+
+# Post-download image processing.
+# Every image in the app folders is decoded (so truncated files and HTML error pages
+# saved as .jpg are caught), checked for size and side-profile aspect ratio (of the bike
+# itself for transparent cut-outs, which often sit on a padded square canvas), tested for
+# real transparency (an alpha channel that is actually used), and re-encoded as a
+# size-bounded WebP plus a thumbnail. Decoding and encoding are CPU-bound, so images are
+# spread over a process pool. manifest.json records the outcome per source file; inputs
+# whose size and mtime have not changed are skipped without being opened.
+
+OUTPUT_DIR = os.path.join(image_store.DATA_DIR, 'processed')
+MANIFEST_NAME = 'manifest.json'
+
+MIN_WIDTH = 400
+MIN_HEIGHT = 200
+# Only clearly wrong shapes are rejected (portraits, banners). This is looser than
+# image_probe's ranking band, which penalizes square product shots but still keeps them.
+MIN_ASPECT = 0.9
+MAX_ASPECT = 3.0
+MAX_PIXELS = 40_000_000      # Refuse decompression bombs
+
+FULL_EDGE = 1600             # Longest edge of the main variant
+THUMB_EDGE = 400
+FULL_MAX_BYTES = 250 * 1024
+THUMB_MAX_BYTES = 40 * 1024
+QUALITY_STEPS = (85, 75, 65, 50)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif')
+
+# Bump when the checks or encoder settings change, so every image is redone
+PIPELINE_VERSION = 2
+
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+def has_real_alpha(img):
+    """True if the image has an alpha channel with at least one non-opaque pixel."""
+    if img.mode == 'P':
+        if 'transparency' not in img.info:
+            return False
+        img = img.convert('RGBA')
+    if img.mode in ('RGBA', 'LA', 'PA'):
+        return img.getchannel('A').getextrema()[0] < 255
+    return False
+
+def content_aspect(img, alpha):
+    """Width / height of the visible content: the alpha bounding box for cut-outs, else the canvas."""
+    box = None
+    if alpha:
+        rgba = img if img.mode in ('RGBA', 'LA') else img.convert('RGBA')
+        box = rgba.getchannel('A').getbbox()
+    left, top, right, bottom = box or (0, 0) + img.size
+    return (right - left) / (bottom - top) if bottom > top else 0
+
+def encode_webp(img, max_edge, max_bytes, alpha):
+    """WebP bytes of img fitted into max_edge, lowering quality until under max_bytes."""
+    img = img.copy()
+    img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    img = img.convert('RGBA' if alpha else 'RGB')
+    data = b''
+    for quality in QUALITY_STEPS:
+        buf = io.BytesIO()
+        img.save(buf, 'WEBP', quality=quality, method=4)
+        data = buf.getvalue()
+        if len(data) <= max_bytes:
+            break
+    return data, img.size
+
+def process_image(src, namespace, out_dir):
+    """Validates one image and writes its variants. Runs in a worker process."""
+    entry = {'status': 'ok'}
+    try:
+        with Image.open(src) as img:
+            img.verify()  # Structure/CRC check; the image must be reopened afterwards
+        with Image.open(src) as img:
+            img.load()
+            img = ImageOps.exif_transpose(img)
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as e:
+        return {'status': 'rejected', 'reason': f"not a decodable image ({e.__class__.__name__})"}
+
+    width, height = img.size
+    alpha = has_real_alpha(img)
+    entry.update({'format': (img.format or '').lower() or None, 'width': width, 'height': height, 'alpha': alpha})
+    aspect = content_aspect(img, alpha)
+    if width < MIN_WIDTH or height < MIN_HEIGHT:
+        entry.update(status='rejected', reason=f"too small ({width}x{height})")
+        return entry
+    if not MIN_ASPECT <= aspect <= MAX_ASPECT:
+        entry.update(status='rejected', reason=f"aspect ratio {aspect:.2f} is not a side profile")
+        return entry
+
+    stem = os.path.splitext(os.path.basename(src))[0]
+    folder = os.path.join(out_dir, namespace)
+    os.makedirs(folder, exist_ok=True)
+    variants = {}
+    for name, edge, max_bytes, suffix in (('full', FULL_EDGE, FULL_MAX_BYTES, ''),
+                                          ('thumb', THUMB_EDGE, THUMB_MAX_BYTES, '_thumb')):
+        data, (w, h) = encode_webp(img, edge, max_bytes, alpha)
+        filename = f"{stem}{suffix}.webp"
+        http_client.write_atomic(os.path.join(folder, filename), data)
+        variants[name] = {'file': f"{namespace}/{filename}", 'width': w, 'height': h, 'bytes': len(data)}
+    entry['variants'] = variants
+    return entry
+
+def _process(task):
+    key, src, namespace, out_dir, stat = task
+    entry = process_image(src, namespace, out_dir)
+    entry.update({'size': stat[0], 'mtime_ns': stat[1], 'version': PIPELINE_VERSION})
+    return key, entry
+
+def _unchanged(entry, stat, out_dir):
+    if not entry or entry.get('version') != PIPELINE_VERSION:
+        return False
+    if (entry.get('size'), entry.get('mtime_ns')) != stat:
+        return False
+    return all(os.path.exists(os.path.join(out_dir, v['file'])) for v in entry.get('variants', {}).values())
+
+def load_manifest(out_dir=OUTPUT_DIR):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def run(namespaces=None, out_dir=OUTPUT_DIR, workers=None, force=False):
+    """Processes new or changed images of the given namespaces; returns (manifest, processed count)."""
+    manifest = {} if force else load_manifest(out_dir)
+    tasks = []
+    seen = set()
+    for namespace in namespaces or image_store.EXPORT_DIRS:
+        folder = image_store.EXPORT_DIRS[namespace]
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            src = os.path.join(folder, name)
+            st = os.stat(src)
+            stat = (st.st_size, st.st_mtime_ns)
+            key = f"{namespace}/{name}"
+            seen.add(key)
+            if not _unchanged(manifest.get(key), stat, out_dir):
+                tasks.append((key, src, namespace, out_dir, stat))
+
+    # Forget files that were deleted from the processed namespaces
+    for key in [k for k in manifest if k.split('/')[0] in (namespaces or image_store.EXPORT_DIRS) and k not in seen]:
+        del manifest[key]
+
+    if tasks:
+        os.makedirs(out_dir, exist_ok=True)
+        workers = min(workers or os.cpu_count() or 1, len(tasks))
+        if workers == 1:
+            for key, entry in map(_process, tasks):
+                manifest[key] = entry
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for key, entry in pool.map(_process, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+                    manifest[key] = entry
+        catalog_store.write_json_atomic(os.path.join(out_dir, MANIFEST_NAME), manifest, indent=2)
+    return manifest, len(tasks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate bike images and build WebP/thumbnail variants.")
+    parser.add_argument("--namespace", choices=sorted(image_store.EXPORT_DIRS), action="append",
+                        help="Only process this folder (repeatable; default: all).")
+    parser.add_argument("--out", default=OUTPUT_DIR, help="Output directory for variants and manifest.")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all cores).")
+    parser.add_argument("--force", action="store_true", help="Reprocess every image.")
+    args = parser.parse_args()
+
+    manifest, processed = run(args.namespace, args.out, args.workers, args.force)
+    rejected = {k: v for k, v in manifest.items() if v['status'] == 'rejected'}
+    print(f"Processed {processed} images ({len(manifest) - processed} unchanged).")
+    print(f"{len(manifest) - len(rejected)} valid, {sum(1 for v in manifest.values() if v.get('alpha'))} with transparency.")
+    for key, entry in sorted(rejected.items()):
+        print(f"  [Rejected] {key}: {entry['reason']}")
+
+if __name__ == "__main__":
+    main()
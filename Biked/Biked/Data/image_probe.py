@@ -0,0 +1,178 @@
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import http_client
+import rate_control
+import search_cache
+
+# Reads just enough of an image (a ranged GET of its first bytes) to learn the format,
+# dimensions and whether it has an alpha channel, so search candidates can be ranked
+# before anything is downloaded.
+
+PROBE_BYTES = 64 * 1024     # JPEG SOF markers can sit behind a large EXIF block
+PROBE_TIMEOUT = (4, 8)
+PROBE_WORKERS = 16
+RETRY_STATUSES = (429, 500, 502, 503, 504)  # "Try later": raised, never cached as "no image"
+# URLs no request can succeed on: a plain miss rather than a transport error
+BAD_URL_ERRORS = (requests.exceptions.InvalidURL, requests.exceptions.MissingSchema,
+                  requests.exceptions.InvalidSchema)
+
+# Ranking preferences: large, side-profile (landscape) shots, cut-outs first.
+# Narrower or off-aspect images are penalized, not dropped: a square product shot still
+# beats no image. Only images below MIN_EDGE on either side are rejected.
+MIN_EDGE = 200
+MIN_WIDTH = 500
+MIN_ASPECT = 1.1
+MAX_ASPECT = 2.4
+IDEAL_ASPECT = 1.65
+TARGET_PIXELS = 1600 * 1000
+SMALL_PENALTY = 0.5    # Narrower than MIN_WIDTH
+ASPECT_PENALTY = 1.0   # Outside MIN_ASPECT..MAX_ASPECT (enough for a landscape JPEG to beat a square cut-out)
+
+_pool = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix='probe')
+
+def parse_header(data):
+    """Returns {'format', 'width', 'height', 'alpha'} from the leading bytes, or None."""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 26:
+        width, height = struct.unpack('>II', data[16:24])
+        color_type = data[25]
+        # 4 = grey+alpha, 6 = RGBA; palette images carry transparency in a tRNS chunk before IDAT
+        chunks = data[:data.find(b'IDAT')] if b'IDAT' in data else data
+        alpha = color_type in (4, 6) or b'tRNS' in chunks
+        return {'format': 'png', 'width': width, 'height': height, 'alpha': alpha}
+
+    if data[:3] == b'\xff\xd8\xff':
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                i += 1 if marker == 0xFF else 2
+                continue
+            length = struct.unpack('>H', data[i + 2:i + 4])[0]
+            # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[i + 5:i + 9])
+                return {'format': 'jpeg', 'width': width, 'height': height, 'alpha': False}
+            i += 2 + length
+        return None
+
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8X':
+            alpha = bool(data[20] & 0x10)
+            width = 1 + int.from_bytes(data[24:27], 'little')
+            height = 1 + int.from_bytes(data[27:30], 'little')
+            return {'format': 'webp', 'width': width, 'height': height, 'alpha': alpha}
+        if chunk == b'VP8L':
+            bits = int.from_bytes(data[21:25], 'little')
+            width = (bits & 0x3FFF) + 1
+            height = ((bits >> 14) & 0x3FFF) + 1
+            alpha = bool((bits >> 28) & 1)
+            return {'format': 'webp', 'width': width, 'height': height, 'alpha': alpha}
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', data[26:30])
+            return {'format': 'webp', 'width': width & 0x3FFF, 'height': height & 0x3FFF, 'alpha': False}
+        return None
+
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        width, height = struct.unpack('<HH', data[6:10])
+        return {'format': 'gif', 'width': width, 'height': height, 'alpha': False}
+
+    return None
+
+def fetch_probe(url):
+    """
+    Ranged GET of the first PROBE_BYTES. Returns the header info, {} if unparsable,
+    None if the server refuses it. Transport errors and throttling / 5xx responses raise
+    (and are not cached).
+    """
+    headers = {'Range': f'bytes=0-{PROBE_BYTES - 1}'}
+    response = http_client.get(url, headers=headers, timeout=PROBE_TIMEOUT, stream=True)
+    with response:
+        if response.status_code in RETRY_STATUSES:
+            raise requests.HTTPError(f"Probe HTTP {response.status_code}", response=response)
+        if response.status_code not in (200, 206):
+            return None
+        content_type = response.headers.get('Content-Type', '').lower()
+        if content_type and not content_type.startswith(http_client.IMAGE_CONTENT_TYPES):
+            return None
+        data = b''
+        # Servers ignoring Range send the whole body: stop reading once we have enough
+        for chunk in response.iter_content(8192):
+            data += chunk
+            info = parse_header(data)
+            if info or len(data) >= PROBE_BYTES:
+                break
+        http_client.record_bytes(url, len(data))
+        return parse_header(data) or {}
+
+def probe(url):
+    """
+    Cached probe: image headers don't change for a given URL. Transport errors, throttling
+    and open circuit breakers raise, so the caller can tell "later" from "no image".
+    """
+    try:
+        return search_cache.get_cache().cached('probe', url, lambda: fetch_probe(url))
+    except BAD_URL_ERRORS:
+        return None
+    except (requests.RequestException, rate_control.HostUnavailable):
+        raise
+    except Exception:
+        return None  # Header bytes we could not make sense of
+
+def score(info):
+    """Higher is better; None means the candidate is rejected outright (tiny images only)."""
+    if info is None:
+        return None
+    if not info:
+        return 0.1  # Reachable but in a format we can't read (e.g. AVIF): last choice
+    width, height = info['width'], info['height']
+    if width < MIN_EDGE or height < MIN_EDGE:
+        return None
+    aspect = width / height
+    s = min(width * height, TARGET_PIXELS) / TARGET_PIXELS
+    s += 1 - abs(aspect - IDEAL_ASPECT) / IDEAL_ASPECT
+    if width < MIN_WIDTH:
+        s -= SMALL_PENALTY
+    if not MIN_ASPECT <= aspect <= MAX_ASPECT:
+        s -= ASPECT_PENALTY
+    if info['alpha']:
+        s += 0.75
+    if info['format'] in ('png', 'webp'):
+        s += 0.25
+    return s
+
+def _probe_unless(url, cancelled):
+    if cancelled is not None and cancelled.is_set():
+        return None
+    return probe(url)
+
+def best_candidate(urls, cancelled=None):
+    """
+    Probes all candidates concurrently and returns (url, info) of the best one, or (None, None).
+    Candidates that could not be probed (throttled, unreachable) are skipped; if that leaves
+    nothing, the first such error is raised so the bike is deferred rather than failed.
+    Probes not started yet when cancelled (a threading.Event) is set are skipped.
+    """
+    if not urls:
+        return None, None
+    futures = [_pool.submit(_probe_unless, url, cancelled) for url in urls]
+    best, best_score, best_info = None, None, None
+    errors = []
+    for url, future in zip(urls, futures):
+        try:
+            info = future.result()
+        except (requests.RequestException, rate_control.HostUnavailable) as e:
+            errors.append(e)
+            continue
+        s = score(info)
+        if s is not None and (best_score is None or s > best_score):
+            best, best_score, best_info = url, s, info
+    if best is None and errors and not (cancelled is not None and cancelled.is_set()):
+        raise errors[0]
+    return best, best_info
@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# Content-addressed image store shared by scraper.py (Data/Images) and
+# download_images.py (Resources/BikeImages).
+# Blobs are named by their SHA-256, so identical images and placeholders are stored once.
+# The manifest maps every file the app expects (per folder) to a blob plus the URL it came
+# from, which lets the scripts skip downloading bytes they already have.
+# `python image_store.py export` materializes the folder layout with hardlinks.
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(DATA_DIR, '.image_store')
+
+# Namespace -> folder the app reads from
+EXPORT_DIRS = {
+    'BikeImages': os.path.join(DATA_DIR, '..', 'Resources', 'BikeImages'),
+    'Images': os.path.join(DATA_DIR, 'Images'),
+}
+
+CHUNK_SIZE = 256 * 1024
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _link_atomic(src, dest):
+    """Hardlinks src to dest (copy across filesystems), replacing dest in one rename."""
+    tmp = f"{dest}.{threading.get_ident()}.link"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+class ImageStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self._lock = threading.Lock()
+        self.files = {}  # namespace -> {filename: {"blob": digest, "url": url}}
+        self.urls = {}   # source url -> {"blob": digest, "ext": ".png"}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                data = json.load(f)
+            self.files = data.get('files', {})
+            self.urls = data.get('urls', {})
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, 'blobs', digest[:2], digest)
+
+    def add_file(self, path, namespace, url=None):
+        """
+        Moves a freshly written file under content addressing: the blob is created (or
+        reused) and path becomes a hardlink to it. Returns the digest.
+        """
+        digest = file_digest(path)
+        blob = self.blob_path(digest)
+        with self._lock:
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                _link_atomic(path, blob)
+            elif not os.path.samefile(path, blob):
+                _link_atomic(blob, path)
+            self._assign(namespace, os.path.basename(path), digest, url)
+        return digest
+
+    def find_url(self, url):
+        """(digest, ext) of a blob already downloaded from url, if it is still in the store."""
+        entry = self.urls.get(url)
+        if entry and os.path.exists(self.blob_path(entry['blob'])):
+            return entry['blob'], entry['ext']
+        return None
+
+    def link(self, digest, namespace, filename, url=None, folder=None):
+        """Materializes a stored blob as filename inside the namespace folder."""
+        dest = os.path.join(folder or EXPORT_DIRS[namespace], filename)
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        with self._lock:
+            _link_atomic(self.blob_path(digest), dest)
+            self._assign(namespace, filename, digest, url)
+        return dest
+
+    def _assign(self, namespace, filename, digest, url):
+        entry = {'blob': digest}
+        if url:
+            entry['url'] = url
+            self.urls[url] = {'blob': digest, 'ext': os.path.splitext(filename)[1]}
+        self.files.setdefault(namespace, {})[filename] = entry
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            tmp = self.manifest_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'files': self.files, 'urls': self.urls}, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.manifest_path)
+
+    def ingest(self, namespace):
+        """Adopts every file already present in a namespace folder."""
+        folder = EXPORT_DIRS[namespace]
+        count = 0
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if os.path.isfile(path) and not name.startswith('.'):
+                self.add_file(path, namespace)
+                count += 1
+        return count
+
+    def export(self, namespace):
+        """Hardlinks every manifest entry of a namespace into its folder."""
+        folder = EXPORT_DIRS[namespace]
+        os.makedirs(folder, exist_ok=True)
+        count = 0
+        for filename, entry in self.files.get(namespace, {}).items():
+            blob = self.blob_path(entry['blob'])
+            dest = os.path.join(folder, filename)
+            if not os.path.exists(blob):
+                print(f"   [Missing blob] {namespace}/{filename}")
+                continue
+            if os.path.exists(dest) and os.path.samefile(blob, dest):
+                continue
+            _link_atomic(blob, dest)
+            count += 1
+        return count
+
+    def stats(self):
+        blobs = set()
+        total = 0
+        for entries in self.files.values():
+            for entry in entries.values():
+                total += 1
+                blobs.add(entry['blob'])
+        size = sum(os.path.getsize(self.blob_path(d)) for d in blobs if os.path.exists(self.blob_path(d)))
+        return total, len(blobs), size
+
+_default = None
+_default_lock = threading.Lock()
+
+def get_store():
+    """Process-wide store shared by the data scripts."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ImageStore()
+        return _default
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed image store for the bike catalog.")
+    parser.add_argument("command", choices=["ingest", "export", "stats"])
+    parser.add_argument("--namespace", choices=sorted(EXPORT_DIRS), action="append",
+                        help="Folder(s) to work on (default: all).")
+    args = parser.parse_args()
+
+    store = get_store()
+    namespaces = args.namespace or sorted(EXPORT_DIRS)
+    if args.command == "ingest":
+        for ns in namespaces:
+            print(f"Ingested {store.ingest(ns)} files from {ns}.")
+        store.save()
+    elif args.command == "export":
+        for ns in namespaces:
+            print(f"Linked {store.export(ns)} files into {ns}.")
+
+    files, blobs, size = store.stats()
+    print(f"{files} files -> {blobs} unique blobs ({size // 1024} KB).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Run metrics for the data scripts.
+# Latency histograms per stage (search_image, download_image, ...) and per host, plus
+# labelled counters (bytes, cache hits/misses, retries, strategy outcomes). Everything
+# lives in memory behind one lock and is cheap enough to leave on; at the end of a run
+# the scripts write it out as JSON or Prometheus text (--metrics run.json / run.prom).
+# profile() optionally wraps a run in cProfile and/or tracemalloc (BIKED_PROFILE=cpu|mem|all).
+
+# Upper bounds in seconds; the last bucket is open-ended
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+PROFILE_ENV = 'BIKED_PROFILE'
+PROFILE_TOP = 25
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the observed max for the last one)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': round(self.sum, 4), 'max': round(self.max, 4),
+                'p50': round(self.quantile(0.5), 4), 'p99': round(self.quantile(0.99), 4),
+                'buckets': {('+Inf' if b == float('inf') else str(b)): n for b, n in zip(BUCKETS, self.counts)}}
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.histograms = {}  # (metric, label value) -> Histogram
+            self.counters = {}    # (metric, sorted label items) -> number
+
+    def observe(self, metric, label, seconds):
+        with self._lock:
+            hist = self.histograms.get((metric, label))
+            if hist is None:
+                hist = self.histograms[(metric, label)] = Histogram()
+            hist.observe(seconds)
+
+    def count(self, metric, value=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def total(self, metric):
+        """Sum of a counter over all its labels."""
+        with self._lock:
+            return sum(value for (m, _), value in self.counters.items() if m == metric)
+
+    def report(self):
+        with self._lock:
+            stages, hosts, counters = {}, {}, {}
+            for (metric, label), hist in sorted(self.histograms.items()):
+                (stages if metric == 'stage' else hosts)[label] = hist.to_dict()
+            for (metric, labels), value in sorted(self.counters.items()):
+                counters.setdefault(metric, []).append(dict(labels, value=value))
+            return {'started': self.started, 'elapsed': round(time.time() - self.started, 3),
+                    'stages': stages, 'hosts': hosts, 'counters': counters}
+
+    def prometheus(self, prefix='biked'):
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric, label_name in (('stage', 'stage'), ('host', 'host')):
+                name = f"{prefix}_{metric}_seconds"
+                lines.append(f"# TYPE {name} histogram")
+                for (m, label), hist in sorted(self.histograms.items()):
+                    if m != metric:
+                        continue
+                    cumulative = 0
+                    for bound, n in zip(BUCKETS, hist.counts):
+                        cumulative += n
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{name}_bucket{{{label_name}="{label}",le="{le}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label_name}="{label}"}} {hist.sum:.6f}')
+                    lines.append(f'{name}_count{{{label_name}="{label}"}} {hist.count}')
+            seen = set()
+            for (metric, labels), value in sorted(self.counters.items()):
+                name = f"{prefix}_{metric}_total"
+                if name not in seen:
+                    lines.append(f"# TYPE {name} counter")
+                    seen.add(name)
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """JSON report, or Prometheus text when path ends in .prom."""
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            if path.endswith('.prom'):
+                f.write(self.prometheus())
+            else:
+                json.dump(self.report(), f, indent=2)
+        os.replace(tmp, path)
+
+    def summary(self, top=8):
+        """Short human-readable lines: the slowest stages by total time."""
+        report = self.report()
+        lines = []
+        for name, h in sorted(report['stages'].items(), key=lambda kv: -kv[1]['sum'])[:top]:
+            lines.append(f"  {name}: {h['count']} calls, {h['sum']:.1f}s total, p50 {h['p50']}s, p99 {h['p99']}s")
+        return lines
+
+METRICS = Metrics()
+
+@contextmanager
+def stage(name):
+    """Times a block as one observation of the stage; exceptions are counted too."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        METRICS.count('stage_errors', stage=name)
+        raise
+    finally:
+        METRICS.observe('stage', name, time.perf_counter() - start)
+
+def timed(name):
+    """Decorator form of stage()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def observe_request(host, seconds, status, size=None, retries=0):
+    METRICS.observe('host', host, seconds)
+    METRICS.count('requests', host=host, status=status)
+    if size:
+        METRICS.count('bytes', size, host=host)
+    if retries:
+        METRICS.count('retries', retries, host=host)
+
+@contextmanager
+def profile(mode=None, output='profile.prof'):
+    """
+    mode: 'cpu' (cProfile, stats saved to output), 'mem' (tracemalloc top allocations),
+    'all', or None to read BIKED_PROFILE. Does nothing when unset.
+    """
+    mode = mode or os.environ.get(PROFILE_ENV, '')
+    cpu = mode in ('cpu', 'all')
+    mem = mode in ('mem', 'all')
+    profiler = cProfile.Profile() if cpu else None
+    if mem:
+        tracemalloc.start(10)
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(output)
+            print(f"\nCPU profile saved to {output}; top functions by cumulative time:")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        if mem:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"\nMemory: {current // 1024} KB live, {peak // 1024} KB peak; top allocation sites:")
+            for stat in snapshot.statistics('lineno')[:PROFILE_TOP]:
+                print(f"  {stat}")
@@ -0,0 +1,412 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from bisect import bisect_right
+
+import numpy as np
+
+import catalog_store
+import instrumentation
+
+# Stock levels per build and size, updated from a feed instead of catalog rewrites.
+# The catalog's builds[].inventory is the base; every stock change read from a feed
+# (CSV or NDJSON rows of build_id, size, qty) is applied in memory and appended to
+# Data/.inventory_deltas.jsonl, one fsync per batch. Quantities are absolute, so replaying
+# the log on top of the catalog is idempotent, and `compact` folds it back into the
+# catalog (one shard rewrite per changed brand) before truncating it.
+# Appends and compaction hold an exclusive lock on Data/.inventory_deltas.jsonl.lock, and
+# each process remembers how far into the log it has read: before writing, it first replays
+# what other processes appended since, so `compact` next to `ingest --follow` loses nothing.
+# The lock file holds a generation number that every compaction bumps, telling the other
+# processes to read the emptied log from the start.
+# Builds in stock are kept in sets keyed by (size, brand, price band) and by (bike, size),
+# so availability queries touch a handful of sets, however many updates arrive. Once a
+# matching.GeometryIndex is attached, the cheapest in-stock price of every geometry row is
+# kept in an array beside it, so fit queries filter the grid rows they read by stock and
+# price without visiting the others.
+#
+#   python inventory.py ingest stock.csv            # or .ndjson, or - for stdin
+#   python inventory.py ingest stock.ndjson --follow
+#   python inventory.py query --size 54 --max-price 10000
+#   python inventory.py query --stack 560 --reach 390 --max-price 10000
+#   python inventory.py compact
+
+DELTA_PATH = os.path.join(catalog_store.DATA_DIR, '.inventory_deltas.jsonl')
+PRICE_BANDS = (2000, 4000, 6000, 8000, 10000, 12000, 15000)  # EUR upper edges; the last band is open
+BATCH_SIZE = 1000      # Feed rows applied per delta-log write
+FOLLOW_INTERVAL = 1.0  # Seconds between polls of a followed feed
+ANY = None             # Brand wildcard in index keys
+
+def price_band(price):
+    return bisect_right(PRICE_BANDS, price or 0)
+
+class BuildStock:
+    __slots__ = ('build_id', 'bike_id', 'brand', 'price', 'band', 'stock')
+
+    def __init__(self, build_id, bike_id, brand, price, stock):
+        self.build_id = build_id
+        self.bike_id = bike_id
+        self.brand = brand
+        self.price = price or 0
+        self.band = price_band(price)
+        self.stock = dict(stock)
+
+class InventoryIndex:
+    def __init__(self, delta_path=DELTA_PATH):
+        self.delta_path = delta_path
+        self.lock_path = delta_path + '.lock'
+        self.offset = 0      # Bytes of the delta log already applied
+        self.generation = 0  # Compactions of the log seen so far (kept in the lock file)
+        self.builds = {}     # build id -> BuildStock
+        self.in_stock = {}   # (size, brand or ANY, band) -> set of build ids with qty > 0
+        self.by_bike = {}    # (bike id, size) -> set of build ids with qty > 0
+        self.pending = 0     # Deltas in the log that the catalog does not have yet
+        self.geometry = None   # Attached matching.GeometryIndex
+        self.geometry_rows = {}  # (bike id, size) -> its geometry row indices
+        self.row_price = None  # Per geometry row: cheapest build in stock (EUR), inf if none
+
+    @classmethod
+    def load(cls, catalog=None, delta_path=DELTA_PATH):
+        """Index over the catalog (open_catalog() by default) with the delta log replayed."""
+        index = cls(delta_path)
+        with instrumentation.stage('inventory_load'):
+            for bike in catalog if catalog is not None else catalog_store.open_catalog():
+                for build in bike.get('builds', []):
+                    index.add_build(bike, build)
+            with catalog_store.locked(index.lock_path) as lock:
+                index.pending = index._replay(lock)
+        return index
+
+    def add_build(self, bike, build):
+        entry = BuildStock(build['id'], bike['id'], bike.get('brand'), build.get('price_eur'),
+                           build.get('inventory') or {})
+        self.builds[entry.build_id] = entry
+        for size, qty in entry.stock.items():
+            if qty > 0:
+                self._link(entry, size)
+
+    def _keys(self, entry, size):
+        return ((size, entry.brand, entry.band), (size, ANY, entry.band))
+
+    def _link(self, entry, size):
+        for key in self._keys(entry, size):
+            self.in_stock.setdefault(key, set()).add(entry.build_id)
+        self.by_bike.setdefault((entry.bike_id, size), set()).add(entry.build_id)
+        self._update_rows(entry.bike_id, size)
+
+    def _unlink(self, entry, size):
+        for key in self._keys(entry, size):
+            self.in_stock[key].discard(entry.build_id)
+        self.by_bike[(entry.bike_id, size)].discard(entry.build_id)
+        self._update_rows(entry.bike_id, size)
+
+    def _update_rows(self, bike_id, size):
+        rows = self.geometry_rows.get((bike_id, size))
+        if rows is not None:
+            ids = self.by_bike.get((bike_id, size))
+            self.row_price[rows] = min(self.builds[i].price for i in ids) if ids else np.inf
+
+    def attach(self, geometry):
+        """Keeps the in-stock price of every row of a matching.GeometryIndex up to date from now on."""
+        rows = {}
+        for row, (bike, size) in enumerate(zip(geometry.bike, geometry.sizes)):
+            rows.setdefault((geometry.bike_ids[bike], str(size)), []).append(row)
+        self.geometry = geometry
+        self.geometry_rows = {key: np.array(value, dtype=np.intp) for key, value in rows.items()}
+        self.row_price = np.full(len(geometry), np.inf)
+        for bike_id, size in self.geometry_rows:
+            self._update_rows(bike_id, size)
+
+    def set_stock(self, build_id, size, qty):
+        """
+        Applies one absolute stock level. Returns True if it changed anything; raises
+        KeyError for an unknown build.
+        """
+        entry = self.builds[build_id]
+        size = str(size)
+        old = entry.stock.get(size)
+        if old == qty:
+            return False
+        entry.stock[size] = qty
+        if (old or 0) > 0 and qty <= 0:
+            self._unlink(entry, size)
+        elif (old or 0) <= 0 and qty > 0:
+            self._link(entry, size)
+        return True
+
+    def _generation(self, lock):
+        lock.seek(0)
+        text = lock.read().strip()
+        return int(text) if text.isdigit() else 0
+
+    def _replay(self, lock):
+        """Applies the log lines past self.offset (written by other processes); call under the lock."""
+        generation = self._generation(lock)
+        if generation != self.generation:
+            # Compacted elsewhere: everything read before is in the catalog now
+            self.generation = generation
+            self.offset = 0
+            self.pending = 0
+        if not os.path.exists(self.delta_path):
+            self.offset = 0
+            return 0
+        count = 0
+        with open(self.delta_path, 'rb') as f:
+            f.seek(self.offset)
+            for line in f:
+                try:
+                    delta = json.loads(line)
+                    self.set_stock(delta['build_id'], delta['size'], delta['qty'])
+                except (ValueError, KeyError):
+                    continue  # Torn last line, or a build that has left the catalog
+                count += 1
+            self.offset = f.tell()
+        return count
+
+    def apply(self, updates):
+        """
+        Applies (build_id, size, qty) updates and appends the effective ones to the delta
+        log in a single write. Returns (changed, unchanged, unknown build ids).
+        """
+        lines, unchanged, unknown = [], 0, []
+        now = round(time.time(), 3)
+        with catalog_store.locked(self.lock_path) as lock:
+            # Other writers' deltas come first, as they do in the log
+            self.pending += self._replay(lock)
+            for build_id, size, qty in updates:
+                try:
+                    changed = self.set_stock(build_id, size, qty)
+                except KeyError:
+                    unknown.append(build_id)
+                    continue
+                if changed:
+                    lines.append(json.dumps({'build_id': build_id, 'size': str(size), 'qty': qty, 'ts': now},
+                                            ensure_ascii=False) + '\n')
+                else:
+                    unchanged += 1
+            if lines:
+                with open(self.delta_path, 'ab') as f:
+                    f.write(''.join(lines).encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self.offset = f.tell()
+                self.pending += len(lines)
+        instrumentation.METRICS.count('inventory_updates', len(lines), result='changed')
+        instrumentation.METRICS.count('inventory_updates', unchanged, result='unchanged')
+        instrumentation.METRICS.count('inventory_updates', len(unknown), result='unknown')
+        return len(lines), unchanged, unknown
+
+    def _bands(self, min_price, max_price):
+        """(band, needs an exact price check) for every band overlapping the price range."""
+        low = price_band(min_price) if min_price is not None else 0
+        high = price_band(max_price) if max_price is not None else len(PRICE_BANDS)
+        return [(band, (band == low and min_price is not None) or (band == high and max_price is not None))
+                for band in range(low, high + 1)]
+
+    def available(self, size, brand=None, min_price=None, max_price=None):
+        """Build ids in stock in `size` (optionally one brand and a EUR price range)."""
+        size = str(size)
+        result = set()
+        for band, check in self._bands(min_price, max_price):
+            ids = self.in_stock.get((size, brand, band))
+            if not ids:
+                continue
+            if not check:
+                result |= ids
+                continue
+            result.update(i for i in ids
+                          if (min_price is None or self.builds[i].price >= min_price)
+                          and (max_price is None or self.builds[i].price <= max_price))
+        return result
+
+    def bike_available(self, bike_id, size, max_price=None):
+        """Build ids of one bike in stock in `size`, at or under max_price."""
+        ids = self.by_bike.get((bike_id, str(size)), ())
+        if max_price is None:
+            return set(ids)
+        return {i for i in ids if self.builds[i].price <= max_price}
+
+    def best_in_stock(self, geometry, stack, reach, tolerance=None, max_price=None):
+        """
+        Best size per bike among the sizes in stock, closest first: [(match, build ids)].
+        A bike whose best-fitting size is sold out falls back to its next best one in stock.
+        """
+        if geometry is not self.geometry:
+            self.attach(geometry)
+
+        def in_stock(rows):
+            prices = self.row_price[rows]
+            return prices < np.inf if max_price is None else prices <= max_price
+        matches = geometry.best_per_bike(stack, reach, tolerance, mask=in_stock)
+        return [(match, sorted(self.bike_available(match.bike_id, match.size, max_price),
+                               key=lambda i: self.builds[i].price))
+                for match in matches]
+
+    def compact(self, catalog=None):
+        """Writes the current stock into the catalog and empties the delta log. Returns bikes saved."""
+        catalog = catalog if catalog is not None else catalog_store.open_catalog()
+        changed = []
+        with instrumentation.stage('inventory_compact'), catalog_store.locked(self.lock_path) as lock:
+            # Deltas appended by a concurrent ingest since load go into this compaction too
+            self.pending += self._replay(lock)
+            for bike in catalog:
+                dirty = False
+                for build in bike.get('builds', []):
+                    entry = self.builds.get(build['id'])
+                    if entry and entry.stock != (build.get('inventory') or {}):
+                        build['inventory'] = dict(entry.stock)
+                        dirty = True
+                if dirty:
+                    changed.append(bike)
+            if changed:
+                catalog.save_many(changed)
+                catalog.commit()
+            # Quantities are absolute: a crash before this truncation only replays the same values
+            open(self.delta_path, 'w').close()
+            self.generation += 1
+            lock.truncate(0)
+            lock.write(str(self.generation))
+            lock.flush()
+            self.offset = 0
+            self.pending = 0
+        return len(changed)
+
+    def stats(self):
+        return {'builds': len(self.builds),
+                'in_stock': sum(1 for e in self.builds.values() for q in e.stock.values() if q > 0),
+                'index_keys': len(self.in_stock), 'pending_deltas': self.pending}
+
+def _row(record):
+    return record['build_id'], str(record['size']).strip(), int(record['qty'])
+
+def _parse(line, is_csv, header):
+    if is_csv:
+        values = next(csv.reader([line]))
+        return _row(dict(zip(header, values)))
+    return _row(json.loads(line))
+
+def read_feed(path, follow=False):
+    """
+    Yields (build_id, size, qty) from a CSV (header: build_id,size,qty) or NDJSON feed
+    (path '-' reads stdin as NDJSON). With follow, keeps polling the file for appended rows
+    and yields None each time it catches up. Malformed rows are reported and skipped.
+    """
+    is_csv = path.lower().endswith('.csv')
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8', newline='')
+    header = None
+    idle = False
+    try:
+        while True:
+            line = f.readline()
+            if not line:
+                if not follow:
+                    return
+                if not idle:
+                    idle = True
+                    yield None
+                time.sleep(FOLLOW_INTERVAL)
+                continue
+            if not line.endswith('\n') and follow:
+                # Row still being written: wait for the rest of it
+                while not line.endswith('\n'):
+                    time.sleep(FOLLOW_INTERVAL)
+                    line += f.readline()
+            idle = False
+            if not line.strip():
+                continue
+            if is_csv and header is None:
+                header = [h.strip() for h in next(csv.reader([line]))]
+                continue
+            try:
+                yield _parse(line, is_csv, header)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"   [Bad row] {line.strip()[:80]} ({e})")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def ingest(index, rows, batch_size=BATCH_SIZE, follow=False):
+    """Applies feed rows in batches; a followed feed is flushed whenever it goes quiet."""
+    totals = [0, 0, 0]
+    batch = []
+
+    def flush():
+        changed, unchanged, unknown = index.apply(batch)
+        for build_id in sorted(set(unknown)):
+            print(f"   [Unknown build] {build_id}")
+        totals[0] += changed
+        totals[1] += unchanged
+        totals[2] += len(unknown)
+        batch.clear()
+
+    with instrumentation.stage('inventory_ingest'):
+        for row in rows:
+            if row is not None:
+                batch.append(row)
+            if batch and (row is None or len(batch) >= batch_size):
+                flush()
+                if follow:
+                    print(f"{totals[0]} changes applied ({index.pending} pending compaction)")
+        if batch:
+            flush()
+    return tuple(totals)
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental stock updates and size availability queries.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("ingest", help="Apply a CSV/NDJSON stock feed (build_id, size, qty).")
+    p.add_argument("feed", help="Feed file, or - for NDJSON on stdin.")
+    p.add_argument("--follow", action="store_true", help="Keep reading rows appended to the feed.")
+    p.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    p.add_argument("--compact", action="store_true", help="Fold the deltas into the catalog afterwards.")
+    q = sub.add_parser("query", help="Builds in stock for a size, or fit matches that are in stock.")
+    q.add_argument("--size", help="Frame size, as in the catalog.")
+    q.add_argument("--brand")
+    q.add_argument("--min-price", type=float)
+    q.add_argument("--max-price", type=float)
+    q.add_argument("--stack", type=float, help="With --reach: best in-stock size per bike for this fit.")
+    q.add_argument("--reach", type=float)
+    q.add_argument("--tolerance", type=float, default=None)
+    sub.add_parser("compact", help="Write the current stock into the catalog and clear the delta log.")
+    sub.add_parser("stats")
+    args = parser.parse_args()
+
+    if args.command == "query" and args.stack is not None and args.reach is not None:
+        bikes = list(catalog_store.open_catalog())
+        index = InventoryIndex.load(bikes)
+    else:
+        bikes = None
+        index = InventoryIndex.load()
+
+    if args.command == "ingest":
+        changed, unchanged, unknown = ingest(index, read_feed(args.feed, args.follow), args.batch_size, args.follow)
+        print(f"\nApplied {changed} stock changes ({unchanged} unchanged, {unknown} for unknown builds); "
+              f"{index.pending} deltas pending compaction.")
+        if args.compact:
+            print(f"Compacted into {index.compact()} bikes.")
+    elif args.command == "query":
+        if bikes is not None:
+            from matching import GeometryIndex
+            geometry = GeometryIndex.from_catalog(bikes)
+            for match, ids in index.best_in_stock(geometry, args.stack, args.reach, args.tolerance, args.max_price):
+                print(f"{match.distance:7.1f} mm  {match.bike_id:<12} size {match.size:<6} "
+                      + ", ".join(f"{i} ({index.builds[i].price:.0f} EUR)" for i in ids))
+        elif args.size:
+            ids = index.available(args.size, args.brand, args.min_price, args.max_price)
+            for build_id in sorted(ids, key=lambda i: index.builds[i].price):
+                entry = index.builds[build_id]
+                print(f"{build_id:<14} {entry.brand:<14} {entry.price:>8.0f} EUR  qty {entry.stock[str(args.size)]}")
+            print(f"{len(ids)} builds in stock.")
+        else:
+            parser.error("query needs --size, or --stack and --reach")
+    elif args.command == "compact":
+        print(f"Compacted {index.pending} deltas into {index.compact()} bikes.")
+    else:
+        for key, value in index.stats().items():
+            print(f"{key}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# Stack/reach fit matching over the catalog (Python port of SearchViewModel.findMatches).
+# Every frame size of every bike becomes one row of a columnar NumPy table
+# (bike index, size, stack, reach, top tube, seat tube). Rows are bucketed into a
+# uniform stack/reach grid, so nearest-size and within-tolerance queries only touch
+# the few cells around the target instead of scanning the whole catalog.
+
+JSON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bikes.json')
+CELL_MM = 10.0  # Grid cell edge; about the usual fit tolerance
+
+Match = namedtuple('Match', 'bike_id size stack reach top_tube seat_tube distance')
+
+def estimate_target_geometry(height_cm, inseam_cm):
+    """
+    Same estimation as SearchViewModel.estimateTargetGeometry (endurance road fit):
+    stack = inseam * 0.69, reach = height * 0.225, both cm -> mm. Works on arrays too.
+    """
+    return np.asarray(inseam_cm) * 0.69 * 10, np.asarray(height_cm) * 0.225 * 10
+
+def _float(value):
+    return np.nan if value is None else float(value)
+
+class GeometryIndex:
+    def __init__(self, bike_ids, sizes, bike, stack, reach, top_tube, seat_tube, cell=CELL_MM):
+        self.bike_ids = list(bike_ids)
+        self.cell = cell
+
+        # Rows grouped per bike (catalog order) for best-size-per-bike scans
+        by_bike = np.argsort(bike, kind='stable')
+        self.bike = np.asarray(bike, dtype=np.int32)[by_bike]
+        self.sizes = np.asarray(sizes, dtype=object)[by_bike]
+        self.stack = np.asarray(stack, dtype=np.float64)[by_bike]
+        self.reach = np.asarray(reach, dtype=np.float64)[by_bike]
+        self.top_tube = np.asarray(top_tube, dtype=np.float64)[by_bike]
+        self.seat_tube = np.asarray(seat_tube, dtype=np.float64)[by_bike]
+        self.group_starts = np.flatnonzero(np.r_[True, self.bike[1:] != self.bike[:-1]]) if len(self.bike) else np.array([], dtype=np.intp)
+
+        # Grid: row order sorted by cell key, with one [start, end) slice per occupied cell
+        if len(self.stack):
+            self._origin = (np.floor(self.stack.min() / cell), np.floor(self.reach.min() / cell))
+            cx, cy = self._cells(self.stack, self.reach)
+            self._width = int(cy.max()) + 1
+            keys = cx * self._width + cy
+            self._order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[self._order]
+            self._keys, self._starts = np.unique(sorted_keys, return_index=True)
+            self._ends = np.r_[self._starts[1:], len(sorted_keys)]
+            self._max_cx, self._max_cy = int(cx.max()), int(cy.max())
+        else:
+            self._keys = np.array([], dtype=np.int64)
+
+    @classmethod
+    def from_catalog(cls, bikes, cell=CELL_MM):
+        bike_ids, sizes, bike, stack, reach, top_tube, seat_tube = [], [], [], [], [], [], []
+        for i, b in enumerate(bikes):
+            bike_ids.append(b['id'])
+            for geo in b.get('geometry', []):
+                if geo.get('stack_mm') is None or geo.get('reach_mm') is None:
+                    continue
+                bike.append(i)
+                sizes.append(geo['size'])
+                stack.append(float(geo['stack_mm']))
+                reach.append(float(geo['reach_mm']))
+                top_tube.append(_float(geo.get('top_tube_mm')))
+                seat_tube.append(_float(geo.get('seat_tube_mm')))
+        return cls(bike_ids, sizes, bike, stack, reach, top_tube, seat_tube, cell=cell)
+
+    @classmethod
+    def from_snapshot(cls, snap, cell=CELL_MM):
+        """Built straight from a snapshot.Snapshot's memory-mapped geometry table."""
+        g = snap.geometry
+        keep = np.flatnonzero(~np.isnan(g['stack']) & ~np.isnan(g['reach']))
+        bike_ids = [snap.string(i) for i in snap.bikes['id']]
+        sizes = [snap.string(i) for i in g['size'][keep]]
+        return cls(bike_ids, sizes, g['bike'][keep], g['stack'][keep], g['reach'][keep],
+                   g['top_tube'][keep], g['seat_tube'][keep], cell=cell)
+
+    @classmethod
+    def load(cls, path=JSON_PATH, cell=CELL_MM):
+        if path.endswith('.snap'):
+            import snapshot
+            return cls.from_snapshot(snapshot.Snapshot(path), cell=cell)
+        with open(path, 'r') as f:
+            return cls.from_catalog(json.load(f), cell=cell)
+
+    def __len__(self):
+        return len(self.stack)
+
+    def padded(self):
+        """
+        Geometry as dense (bikes x max sizes) stack/reach matrices, padded with inf, plus the
+        row index of every cell (-1 for padding). Used for broadcast matching of many riders.
+        """
+        n_bikes = len(self.bike_ids)
+        counts = np.bincount(self.bike, minlength=n_bikes)
+        width = int(counts.max()) if len(counts) else 0
+        stack = np.full((n_bikes, width), np.inf)
+        reach = np.full((n_bikes, width), np.inf)
+        rows = np.full((n_bikes, width), -1, dtype=np.int64)
+        starts = np.zeros(n_bikes, dtype=np.int64)
+        starts[1:] = np.cumsum(counts)[:-1]
+        slot = np.arange(len(self.bike)) - starts[self.bike]
+        stack[self.bike, slot] = self.stack
+        reach[self.bike, slot] = self.reach
+        rows[self.bike, slot] = np.arange(len(self.bike))
+        return stack, reach, rows
+
+    def _cells(self, stack, reach):
+        cx = (np.floor(np.asarray(stack) / self.cell) - self._origin[0]).astype(np.int64)
+        cy = (np.floor(np.asarray(reach) / self.cell) - self._origin[1]).astype(np.int64)
+        return cx, cy
+
+    def _rows_in_cells(self, x0, x1, y0, y1):
+        """Row indices of every occupied cell in the inclusive cell rectangle."""
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self._max_cx), min(y1, self._max_cy)
+        if x0 > x1 or y0 > y1:
+            return np.array([], dtype=np.intp)
+        xs = np.arange(x0, x1 + 1)
+        # One contiguous key range per grid column
+        lo = np.searchsorted(self._keys, xs * self._width + y0, side='left')
+        hi = np.searchsorted(self._keys, xs * self._width + y1, side='right')
+        slices = [np.arange(self._starts[a], self._ends[b - 1]) for a, b in zip(lo, hi) if b > a]
+        if not slices:
+            return np.array([], dtype=np.intp)
+        return self._order[np.concatenate(slices)]
+
+    def _matches(self, rows, distances):
+        return [Match(self.bike_ids[self.bike[r]], self.sizes[r], float(self.stack[r]), float(self.reach[r]),
+                      None if np.isnan(self.top_tube[r]) else float(self.top_tube[r]),
+                      None if np.isnan(self.seat_tube[r]) else float(self.seat_tube[r]), float(d))
+                for r, d in zip(rows, distances)]
+
+    def within_rows(self, stack, reach, tolerance):
+        """(rows, distances) arrays of every size within tolerance mm, closest first."""
+        if not len(self._keys):
+            return np.array([], dtype=np.intp), np.array([])
+        (x0, x1), (y0, y1) = self._cells([stack - tolerance, stack + tolerance],
+                                         [reach - tolerance, reach + tolerance])
+        rows = self._rows_in_cells(int(x0), int(x1), int(y0), int(y1))
+        d = np.hypot(self.stack[rows] - stack, self.reach[rows] - reach)
+        keep = np.flatnonzero(d <= tolerance)
+        keep = keep[np.argsort(d[keep], kind='stable')]
+        return rows[keep], d[keep]
+
+    def within(self, stack, reach, tolerance, limit=None):
+        """Every frame size within tolerance mm (Euclidean) of the target, closest first."""
+        rows, d = self.within_rows(stack, reach, tolerance)
+        return self._matches(rows[:limit], d[:limit])
+
+    def nearest(self, stack, reach, k=1):
+        """The k frame sizes closest to the target (any bike)."""
+        n = len(self.stack)
+        if n == 0:
+            return []
+        k = min(k, n)
+        cx, cy = (int(v) for v in self._cells(stack, reach))
+        max_ring = max(self._max_cx, self._max_cy) + abs(cx) + abs(cy) + 1
+        ring = 0
+        while True:
+            rows = self._rows_in_cells(cx - ring, cx + ring, cy - ring, cy + ring)
+            if len(rows) >= k:
+                d = np.hypot(self.stack[rows] - stack, self.reach[rows] - reach)
+                best = np.argpartition(d, k - 1)[:k] if k < len(d) else np.arange(len(d))
+                best = best[np.argsort(d[best], kind='stable')]
+                # Anything outside the searched square is at least ring * cell away
+                if d[best[-1]] <= ring * self.cell or ring >= max_ring:
+                    return self._matches(rows[best], d[best])
+            ring += 1
+
+    def best_rows(self, stack, reach, tolerance=None, mask=None):
+        """
+        (rows, distances) of the best size per bike, closest bike first. mask restricts the
+        choice to some sizes: one bool per row, or a function taking row indices and returning
+        their bools (only called on the grid rows near the target when there is a tolerance).
+        Bikes with none of those sizes are left out.
+        """
+        if tolerance is not None:
+            rows, d = self.within_rows(stack, reach, tolerance)
+            if mask is not None:
+                keep = mask(rows) if callable(mask) else mask[rows]
+                rows, d = rows[keep], d[keep]
+            # Rows are sorted by distance: the first row seen per bike is its best size
+            _, first = np.unique(self.bike[rows], return_index=True)
+            first.sort()
+            return rows[first], d[first]
+        if not len(self.stack):
+            return np.array([], dtype=np.intp), np.array([])
+        d = np.hypot(self.stack - stack, self.reach - reach)
+        if mask is not None:
+            d[~(mask(np.arange(len(d))) if callable(mask) else mask)] = np.inf
+        mins = np.minimum.reduceat(d, self.group_starts)
+        counts = np.diff(np.r_[self.group_starts, len(d)])
+        hits = np.flatnonzero((d == np.repeat(mins, counts)) & (d < np.inf))
+        # First row reaching the minimum in each bike group
+        _, first = np.unique(self.bike[hits], return_index=True)
+        rows = hits[first]
+        rows = rows[np.argsort(d[rows], kind='stable')]
+        return rows, d[rows]
+
+    def best_per_bike(self, stack, reach, tolerance=None, limit=None, mask=None):
+        """
+        Best size for every bike, sorted by distance (findMatches).
+        With a tolerance only bikes having a size inside it are returned, via the grid.
+        """
+        rows, d = self.best_rows(stack, reach, tolerance, mask)
+        return self._matches(rows[:limit], d[:limit])
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the best-fitting bikes for a target stack/reach.")
+    parser.add_argument("--stack", type=float, required=True, help="Target stack in mm.")
+    parser.add_argument("--reach", type=float, required=True, help="Target reach in mm.")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Only list bikes with a size within this many mm.")
+    parser.add_argument("--nearest", type=int, default=None,
+                        help="List the N closest frame sizes instead of one size per bike.")
+    parser.add_argument("--limit", type=int, default=None, help="Show at most this many results.")
+    parser.add_argument("--catalog", default=JSON_PATH, help="Path to bikes.json.")
+    args = parser.parse_args()
+
+    index = GeometryIndex.load(args.catalog)
+    if args.nearest:
+        matches = index.nearest(args.stack, args.reach, args.nearest)
+    else:
+        matches = index.best_per_bike(args.stack, args.reach, args.tolerance, args.limit)
+
+    for m in matches:
+        print(f"{m.distance:7.1f} mm  {m.bike_id:<12} size {m.size:<6} stack {m.stack:.0f}  reach {m.reach:.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import codecs
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import http_client
+import search_cache
+
+# Streaming <head> metadata extraction for product pages.
+# Brand sites often serve 1-3 MB of HTML, but the image hints we need (og:image,
+# twitter:image, link rel=image_src) live in <head>. The page is read in small chunks
+# and fed to an incremental parser that stops at </head> (or <body>, or a byte budget),
+# so the body is never downloaded or parsed.
+
+HEAD_BUDGET = 128 * 1024
+CHUNK_SIZE = 4096
+
+# Lower is better: og:image wins, then twitter:image, then link rel=image_src
+PRIORITY = {'og:image': 0, 'twitter:image': 1, 'image_src': 2}
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.I)
+CHARSET_SNIFF_BYTES = 4096
+
+def html_charset(content_type, data):
+    """
+    Encoding of an HTML body: the Content-Type charset, else a <meta charset> (or http-equiv)
+    in its first bytes, else utf-8. requests' ISO-8859-1 default for text/* is never used.
+    """
+    candidates = []
+    match = re.search(r'charset\s*=\s*["\']?([\w.:-]+)', content_type or '', re.I)
+    if match:
+        candidates.append(match.group(1))
+    match = META_CHARSET.search(data[:CHARSET_SNIFF_BYTES])
+    if match:
+        candidates.append(match.group(1).decode('ascii'))
+    for name in candidates:
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            continue
+    return 'utf-8'
+
+class HeadImageParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.found = {}
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'body':
+            self.done = True
+            return
+        attrs = dict(attrs)
+        if tag == 'meta':
+            key = (attrs.get('property') or attrs.get('name') or '').lower()
+            if key in ('og:image', 'twitter:image') and attrs.get('content'):
+                self.found.setdefault(key, attrs['content'])
+        elif tag == 'link':
+            rel = (attrs.get('rel') or '').lower().split()
+            if 'image_src' in rel and attrs.get('href'):
+                self.found.setdefault('image_src', attrs['href'])
+        if 'og:image' in self.found:
+            self.done = True  # Nothing can beat it
+
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            self.done = True
+
+    def best(self):
+        if not self.found:
+            return None
+        key = min(self.found, key=PRIORITY.get)
+        return self.found[key]
+
+def extract_head_image(url, budget=HEAD_BUDGET):
+    """Streams url until its <head> is parsed and returns the best image URL (absolute) or None."""
+    response = http_client.get(url, timeout=10, stream=True)
+    with response:
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        decoder = None
+        parser = HeadImageParser()
+        read = 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if decoder is None:
+                encoding = html_charset(response.headers.get('Content-Type'), chunk)
+                decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            read += len(chunk)
+            parser.feed(decoder.decode(chunk))
+            if parser.done or read >= budget:
+                break
+        http_client.record_bytes(url, read)
+        image = parser.best()
+        return urljoin(response.url, image) if image else None
+
+def head_image(url):
+    """Cached per page URL (including "no image" results); errors are not cached."""
+    return search_cache.get_cache().cached('og', url, lambda: extract_head_image(url))
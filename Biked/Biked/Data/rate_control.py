@@ -0,0 +1,141 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# Adaptive per-host rate control for the data scripts.
+# Each host contacted gets a token bucket whose rate grows additively while responses
+# are healthy and is cut multiplicatively on 429/503 (AIMD). Retry-After blocks the host
+# until the given time, and a host that keeps failing trips a circuit breaker: requests
+# to it fail fast until a cooldown passes and a single trial request succeeds.
+# Hosts that are never contacted are never throttled.
+
+# Starting rates in requests/second, keyed like http_client.host_key()
+INITIAL_RATES = {
+    'bing': 0.5,
+    'duckduckgo': 0.5,
+    'wikimedia': 2.0,
+}
+DEFAULT_RATE = 2.0
+MIN_RATE = 0.05
+MAX_RATE = 10.0
+INCREASE_STEP = 0.05        # Added to the rate after every healthy response
+DECREASE_FACTOR = 0.5       # Rate multiplier on 429/503
+THROTTLE_STATUSES = (429, 503)
+FAILURE_STATUSES = (429, 500, 502, 503, 504)
+
+BREAKER_THRESHOLD = 5       # Consecutive failures that open the circuit
+BREAKER_COOLDOWN = 120.0    # Seconds before a trial request; doubles on every re-open
+MAX_COOLDOWN = 1800.0
+
+class HostUnavailable(Exception):
+    """The host's circuit breaker is open: the request was not sent."""
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (now or time.time()))
+
+class HostState:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self.cooldown = BREAKER_COOLDOWN
+        self.trial_in_flight = False
+        self.requests = 0
+        self.throttled = 0
+
+    def refill(self, now):
+        burst = max(1.0, self.rate)
+        self.tokens = min(burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class RateController:
+    def __init__(self, initial_rates=None, default_rate=DEFAULT_RATE):
+        self.initial_rates = dict(INITIAL_RATES if initial_rates is None else initial_rates)
+        self.default_rate = default_rate
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostState(self.initial_rates.get(host, self.default_rate))
+        return state
+
+    def acquire(self, host):
+        """Blocks until the host may be contacted; raises HostUnavailable while its circuit is open."""
+        while True:
+            with self._lock:
+                state = self._state(host)
+                now = time.monotonic()
+                if state.failures >= BREAKER_THRESHOLD:
+                    if now < state.open_until or state.trial_in_flight:
+                        raise HostUnavailable(f"{host}: circuit open after {state.failures} failures")
+                    state.trial_in_flight = True  # Half-open: let one request through
+                    state.requests += 1
+                    return
+                state.refill(now)
+                wait = max(state.blocked_until - now, 0.0)
+                if wait == 0.0 and state.tokens >= 1.0:
+                    state.tokens -= 1.0
+                    state.requests += 1
+                    return
+                if wait == 0.0:
+                    wait = (1.0 - state.tokens) / state.rate
+            time.sleep(wait)
+
+    def record(self, host, status, retry_after=None):
+        """Feeds a response back: adjusts the rate and the breaker."""
+        with self._lock:
+            state = self._state(host)
+            state.trial_in_flight = False
+            now = time.monotonic()
+            delay = parse_retry_after(retry_after)
+            if status in THROTTLE_STATUSES or delay is not None:
+                state.throttled += 1
+                state.rate = max(MIN_RATE, state.rate * DECREASE_FACTOR)
+                state.tokens = min(state.tokens, 0.0)
+                if delay is not None:
+                    state.blocked_until = max(state.blocked_until, now + delay)
+            if status in FAILURE_STATUSES:
+                self._failure(state, now)
+            else:
+                state.failures = 0
+                state.cooldown = BREAKER_COOLDOWN
+                if delay is None:
+                    state.rate = min(MAX_RATE, state.rate + INCREASE_STEP)
+
+    def record_error(self, host):
+        """Connection errors and timeouts count towards the breaker."""
+        with self._lock:
+            state = self._state(host)
+            state.trial_in_flight = False
+            self._failure(state, time.monotonic())
+
+    def _failure(self, state, now):
+        state.failures += 1
+        if state.failures == BREAKER_THRESHOLD:
+            state.open_until = now + state.cooldown
+        elif state.failures > BREAKER_THRESHOLD:
+            # Failed trial request: re-open for longer
+            state.cooldown = min(MAX_COOLDOWN, state.cooldown * 2)
+            state.open_until = now + state.cooldown
+
+    def snapshot(self):
+        """Per-host rate, request and throttle counts, for end-of-run reporting."""
+        with self._lock:
+            return {host: {'rate': round(s.rate, 3), 'requests': s.requests, 'throttled': s.throttled,
+                           'circuit_open': s.failures >= BREAKER_THRESHOLD}
+                    for host, s in self._hosts.items()}
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import catalog_store
+
+# Append-only journal of per-bike refresh outcomes.
+# Every processed bike appends one JSON line as soon as it finishes, so an interrupted
+# run can be resumed and later runs only touch bikes whose source fingerprint changed.
+# Appends and compaction hold an exclusive lock on .refresh_journal.jsonl.lock (threads
+# and processes alike), so a compaction never drops a line appended while it runs.
+
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.refresh_journal.jsonl')
+
+def fingerprint(bike, *overrides):
+    """Hash of everything that decides which image a bike gets."""
+    parts = [bike.get('brand'), bike.get('model'), bike.get('year'), bike.get('official_url')]
+    parts.extend(overrides)
+    raw = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+class RefreshJournal:
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Returns the latest entry per bike id. A torn last line (crash mid-write) is ignored."""
+        state = {}
+        if not os.path.exists(self.path):
+            return state
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                state[entry['id']] = entry
+        return state
+
+    def record(self, bike_id, fp, status, image=None, size=None, **extra):
+        entry = {'id': bike_id, 'fingerprint': fp, 'status': status, 'image': image,
+                 'size': size, 'ts': time.time()}
+        entry.update(extra)
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock, catalog_store.locked(self.lock_path):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        return entry
+
+    def compact(self):
+        """Rewrites the journal with only the latest entry per bike."""
+        tmp = self.path + '.tmp'
+        with self._lock, catalog_store.locked(self.lock_path):
+            state = self.load()
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for entry in state.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp, self.path)
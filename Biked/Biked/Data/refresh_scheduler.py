@@ -0,0 +1,101 @@
+import time
+
+import instrumentation
+
+# Refresh planning for download_images.py, driven by the refresh journal.
+# Each journal entry carries the bike's history (last success, last failure, consecutive
+# failures, last winning strategy), so a run can be planned as one prioritized queue:
+# new or changed bikes first, then images that are missing on disk, then successes older
+# than STALE_AFTER (oldest first), then failures whose exponential backoff has expired
+# (fewest failures first). Bikes still inside their backoff window cost nothing, and the
+# run stops dispatching once its request budget is spent.
+# Only a bike's own failures (no usable image, download rejected) count toward backoff.
+# A bike cut short by the run itself (circuit breaker open, network errors, search engine
+# refusing) is journaled as 'deferred' and simply retried on the next run.
+
+STALE_AFTER = 30 * 24 * 3600     # A successful image is re-checked after this long
+BACKOFF_BASE = 6 * 3600          # Wait after the first failure; doubles per consecutive failure
+BACKOFF_MAX = 30 * 24 * 3600
+PRIORITY = {'force': 0, 'new': 0, 'changed': 0, 'missing': 1, 'deferred': 2, 'stale': 2, 'retry': 3}
+
+def history(entry, status, strategy, now=None):
+    """
+    History fields for the next journal entry after an `ok`, `failed` or `deferred` outcome.
+    A deferred outcome leaves the history as it was. Entries written before the scheduler
+    existed are read as a single data point.
+    """
+    now = now or time.time()
+    previous = entry or {}
+    fields = {
+        'last_success': previous.get('last_success', previous.get('ts') if previous.get('status') == 'ok' else None),
+        'last_failure': previous.get('last_failure', previous.get('ts') if previous.get('status') == 'failed' else None),
+        'failures': previous.get('failures', 1 if previous.get('status') == 'failed' else 0),
+        'winner': previous.get('winner', previous.get('strategy') if previous.get('status') == 'ok' else None),
+    }
+    if status == 'ok':
+        fields.update(last_success=now, failures=0, winner=strategy)
+    elif status == 'failed':
+        fields.update(last_failure=now, failures=fields['failures'] + 1)
+    return fields
+
+def backoff(failures):
+    """Seconds to wait before retrying a bike that failed `failures` times in a row."""
+    if failures <= 0:
+        return 0
+    return min(BACKOFF_BASE * 2 ** (failures - 1), BACKOFF_MAX)
+
+def due(entry, now=None):
+    """
+    Why a journaled bike with an unchanged fingerprint should run now: 'stale', 'retry',
+    'deferred', or None while it is fresh or still backing off.
+    """
+    now = now or time.time()
+    if entry['status'] == 'deferred':
+        return 'deferred'
+    if entry['status'] == 'ok':
+        last = entry.get('last_success', entry.get('ts', 0))
+        return 'stale' if now - last >= STALE_AFTER else None
+    failures = entry.get('failures', 1)
+    last = entry.get('last_failure', entry.get('ts', 0))
+    return 'retry' if now - last >= backoff(failures) else None
+
+def retry_at(entry):
+    """When a failed bike leaves its backoff window (epoch seconds)."""
+    return entry.get('last_failure', entry.get('ts', 0)) + backoff(entry.get('failures', 1))
+
+def plan(items):
+    """
+    items: (bike, reason, journal entry or None). Returns them as the run's work queue,
+    highest priority first; ties keep catalog order for new bikes.
+    """
+    def key(item):
+        _, reason, entry = item
+        entry = entry or {}
+        if reason == 'stale':
+            return PRIORITY[reason], entry.get('last_success', entry.get('ts', 0)), 0
+        if reason == 'retry':
+            return PRIORITY[reason], entry.get('failures', 1), entry.get('last_failure', entry.get('ts', 0))
+        return PRIORITY[reason], 0, 0
+    queue = sorted(items, key=key)
+    for _, reason, _ in queue:
+        instrumentation.METRICS.count('refresh_queue', reason=reason)
+    return queue
+
+class RunBudget:
+    """
+    Soft cap on the network requests of one run, read from the instrumentation counters:
+    every request plus the urllib3 retries it needed, since each retry hits the server again.
+    New bikes are only dispatched while requests remain; bikes already running finish.
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.start = self._total()
+
+    def _total(self):
+        return instrumentation.METRICS.total('requests') + instrumentation.METRICS.total('retries')
+
+    def spent(self):
+        return self._total() - self.start
+
+    def allows(self):
+        return self.limit is None or self.spent() < self.limit
@@ -1,8 +1,12 @@
+import argparse
 import json
 import os
-import requests
 from bs4 import BeautifulSoup
-import time
+
+import geometry_scraper
+import http_client
+import image_store
+import instrumentation
 
 # --- Models (Python equivalent of Swift models) ---
 
@@ -48,12 +52,14 @@ class Bike:
 # Path to the raw image in the repo. 
 # Matches structure: BikeGeometryFinder/Biked/Biked/Data/Images/
 GITHUB_REPO_URL = "https://raw.githubusercontent.com/gtrujillovdev-cyber/Biked/main/Biked/Biked/Data/Images/"
+REVALIDATE = False  # --refresh: ask the servers again (conditional requests) instead of reusing local copies
 
-import shutil
-
+@instrumentation.timed('download_image')
 def download_image(url, filename):
     """
     Downloads the image to the local Images/ folder and returns the GitHub Raw URL.
+    Existing files and stored blobs are reused unless REVALIDATE is set; then the download
+    goes out with the stored validators and an unchanged image costs a 304.
     """
     # Ensure directory exists
     if not os.path.exists("Images"):
@@ -63,37 +69,57 @@ def download_image(url, filename):
     placeholder_path = os.path.join("Images", "placeholder.png")
     
     # If file exists and hash content (and isn't the placeholder itself, although hard to check easily, size > 2KB checks for empty file)
-    if os.path.exists(local_path) and os.path.getsize(local_path) > 1000:
+    if not REVALIDATE and os.path.exists(local_path) and os.path.getsize(local_path) > 1000:
         print(f"   [Cache] {filename} exists ({os.path.getsize(local_path)} bytes).")
         return GITHUB_REPO_URL + filename
         
+    store = image_store.get_store()
+    known = None if REVALIDATE else store.find_url(url)
+    if known:
+        # Same source already in the content-addressed store: link it, no download
+        store.link(known[0], 'Images', filename, url=url, folder="Images")
+        print(f"   [Store] {filename} linked from stored blob.")
+        return GITHUB_REPO_URL + filename
+
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
-        }
         print(f"   [Downloading] {url} -> {filename}...")
-        r = requests.get(url, headers=headers, timeout=30)
-        if r.status_code == 200:
-            with open(local_path, "wb") as f:
-                f.write(r.content)
-            print(f"   -> Success: {len(r.content)} bytes")
-            return GITHUB_REPO_URL + filename
-        else:
-            print(f"   [Error] Download failed: {r.status_code}")
+        # Streamed into a temp file and renamed into place; error pages and oversized files are refused early
+        _, size, not_modified = http_client.download_file(url, local_path, min_bytes=1000, timeout=(5, 30))
+        store.add_file(local_path, 'Images', url=url)
+        print(f"   -> {'Not modified' if not_modified else 'Success'}: {size} bytes")
+        return GITHUB_REPO_URL + filename
+    except http_client.DownloadRejected as e:
+        print(f"   [Error] Download rejected: {e}")
     except Exception as e:
         print(f"   [Error] {e}")
     
-    # Fallback: Copy placeholder to this filename so the app has *something*
+    # Fallback: Link the placeholder to this filename so the app has *something*
+    # (one stored blob, however many bikes fail)
     if os.path.exists(placeholder_path):
         print(f"   [Fallback] Using placeholder for {filename}")
-        shutil.copy(placeholder_path, local_path)
+        digest = store.add_file(placeholder_path, 'Images')
+        store.link(digest, 'Images', filename, folder="Images")
         return GITHUB_REPO_URL + filename
     
     return url # Total failure fallback to remote URL
 
 def scrape_bike_metadata(url, brand, model_fallback):
-    # (Kept for future use, but not used in initial DB generation to verify images first)
-    pass
+    """
+    Reads the geometry table of a product page (see geometry_scraper.py for the
+    concurrent, catalog-wide version). Returns (model name, [Geometry]).
+    """
+    try:
+        html, _ = geometry_scraper.fetch_page(url)
+    except Exception as e:
+        print(f"   [Error] {brand} {model_fallback}: {e}")
+        return model_fallback, []
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.find('meta', property='og:title') or soup.find('h1')
+    model_name = (title.get('content') if title and title.name == 'meta' else title.get_text(strip=True) if title else '') or model_fallback
+    geometries = [Geometry(g['size'], g['stack_mm'], g['reach_mm'], g.get('top_tube_mm'),
+                           g.get('seat_tube_angle'), g.get('head_tube_angle'))
+                  for g in geometry_scraper.parse_geometry(html)]
+    return model_name, geometries
 
 def get_initial_database():
     bikes = []
@@ -234,6 +260,13 @@ def save_to_json(bikes, filename="bikes.json"):
     print(f"Database saved to {filename} with {len(bikes)} bikes.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate bikes.json from the built-in database and download its images.")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Revalidate every image with the server instead of reusing local copies.")
+    REVALIDATE = parser.parse_args().refresh
     print("Generating Bike Database and Downloading Images...")
     bikes = get_initial_database()
     save_to_json(bikes)
+    image_store.get_store().save()
+    for line in instrumentation.METRICS.summary():
+        print(line)
@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import instrumentation
+
+# Persistent cache for search-engine lookups (Bing, Wikimedia, ...).
+# Entries are keyed by (engine, query, filters), expire after a per-entry TTL and the
+# table is bounded with least-recently-used eviction. Empty results are cached too
+# ("negative caching") with a shorter TTL so re-runs don't keep asking for nothing.
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.search_cache.sqlite')
+DEFAULT_TTL = 14 * 24 * 3600   # Search results for a model are stable for weeks
+NEGATIVE_TTL = 2 * 24 * 3600   # Retry "no result" sooner
+MAX_ENTRIES = 50000
+
+class SearchCache:
+    def __init__(self, path=DB_PATH, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                engine    TEXT NOT NULL,
+                query     TEXT NOT NULL,
+                filters   TEXT NOT NULL,
+                value     TEXT NOT NULL,
+                expires   REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (engine, query, filters)
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+        self._conn.commit()
+
+    def get(self, engine, query, filters=''):
+        """Returns (hit, value). Expired entries count as misses."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM entries WHERE engine=? AND query=? AND filters=?",
+                (engine, query, filters)).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                instrumentation.METRICS.count('search_cache', engine=engine, result='miss')
+                return False, None
+            self._conn.execute(
+                "UPDATE entries SET last_used=? WHERE engine=? AND query=? AND filters=?",
+                (now, engine, query, filters))
+            self._conn.commit()
+            self.hits += 1
+        instrumentation.METRICS.count('search_cache', engine=engine, result='hit')
+        return True, json.loads(row[0])
+
+    def put(self, engine, query, value, filters='', ttl=None):
+        if ttl is None:
+            ttl = self.ttl if value else self.negative_ttl
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (engine, query, filters, value, expires, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (engine, query, filters, json.dumps(value), now + ttl, now))
+            self._evict()
+            self._conn.commit()
+
+    def cached(self, engine, query, fetch, filters=''):
+        """
+        Returns the cached value or calls fetch() and stores its result.
+        fetch should raise on transport errors so that failures are never cached.
+        """
+        hit, value = self.get(engine, query, filters)
+        if hit:
+            return value
+        value = fetch()
+        self.put(engine, query, value, filters)
+        return value
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count <= self.max_entries:
+            return
+        # Drop expired rows first, then the least recently used ones (10% headroom)
+        self._conn.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        excess = count - int(self.max_entries * 0.9)
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE rowid IN "
+                "(SELECT rowid FROM entries ORDER BY last_used LIMIT ?)", (excess,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_default = None
+_default_lock = threading.Lock()
+
+def get_cache():
+    """Process-wide cache shared by the data scripts."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = SearchCache()
+        return _default
@@ -0,0 +1,354 @@
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+import catalog_store
+
+# Compact binary snapshot of the catalog for fast cold loads.
+# The catalog is compiled into fixed-width little-endian tables (bikes, geometry, builds,
+# images, inventory) plus one interned string table for ids, brands, sizes, categories...
+# and an id index sorted by bike id. Loading mmaps the file and wraps every table with
+# np.frombuffer, so nothing is parsed or copied up front; records are read through small
+# __slots__ views.
+
+SNAPSHOT_PATH = os.path.join(catalog_store.DATA_DIR, 'catalog.snap')
+MAGIC = b'BIKESNAP'
+VERSION = 2
+NONE = 0xFFFFFFFF  # String index for missing values
+
+BIKE_DTYPE = np.dtype([
+    ('id', '<u4'), ('brand', '<u4'), ('model', '<u4'), ('category', '<u4'),
+    ('description', '<u4'), ('official_url', '<u4'), ('year', '<i4'),
+    ('geo_start', '<u4'), ('geo_count', '<u4'), ('build_start', '<u4'), ('build_count', '<u4'),
+])
+GEOMETRY_DTYPE = np.dtype([
+    ('bike', '<u4'), ('size', '<u4'),
+    ('stack', '<f4'), ('reach', '<f4'), ('top_tube', '<f4'), ('seat_tube', '<f4'),
+    ('seat_angle', '<f4'), ('head_angle', '<f4'),
+])
+BUILD_DTYPE = np.dtype([
+    ('bike', '<u4'), ('id', '<u4'), ('name', '<u4'), ('color', '<u4'), ('price', '<f8'),
+    ('groupset', '<u4'), ('wheelset', '<u4'), ('power_meter', '<u4'),
+    ('image_start', '<u4'), ('image_count', '<u4'), ('inv_start', '<u4'), ('inv_count', '<u4'),
+])
+IMAGE_DTYPE = np.dtype([('build', '<u4'), ('url', '<u4')])
+INVENTORY_DTYPE = np.dtype([('build', '<u4'), ('size', '<u4'), ('qty', '<i4')])
+
+# name, dtype (None = raw bytes); order is the on-disk order
+SECTIONS = [
+    ('strdata', None),
+    ('stroffs', np.dtype('<u8')),
+    ('bikes', BIKE_DTYPE),
+    ('geometry', GEOMETRY_DTYPE),
+    ('builds', BUILD_DTYPE),
+    ('images', IMAGE_DTYPE),
+    ('inventory', INVENTORY_DTYPE),
+    ('idindex', np.dtype('<u4')),
+]
+HEADER = struct.Struct('<8sII')         # magic, version, section count
+SECTION = struct.Struct('<16sQQ')       # name, offset, item count
+ALIGN = 8
+
+def _nan(value):
+    return np.nan if value is None else value
+
+class _Strings:
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def intern(self, value):
+        if value is None:
+            return NONE
+        value = str(value)
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+def compile_snapshot(bikes, path=SNAPSHOT_PATH):
+    """Compiles an iterable of catalog records (bikes.json schema) into a snapshot file."""
+    strings = _Strings()
+    bike_rows, geo_rows, build_rows, image_rows, inv_rows = [], [], [], [], []
+    for bike in bikes:
+        b = len(bike_rows)
+        geo_start, build_start = len(geo_rows), len(build_rows)
+        for geo in bike.get('geometry', []):
+            geo_rows.append((b, strings.intern(geo.get('size')), _nan(geo.get('stack_mm')),
+                             _nan(geo.get('reach_mm')), _nan(geo.get('top_tube_mm')),
+                             _nan(geo.get('seat_tube_mm')), _nan(geo.get('seat_tube_angle')),
+                             _nan(geo.get('head_tube_angle'))))
+        for build in bike.get('builds', []):
+            k = len(build_rows)
+            specs = build.get('specs') or {}
+            image_start, inv_start = len(image_rows), len(inv_rows)
+            for url in build.get('images', []):
+                image_rows.append((k, strings.intern(url)))
+            for size, qty in (build.get('inventory') or {}).items():
+                inv_rows.append((k, strings.intern(size), int(qty)))
+            build_rows.append((b, strings.intern(build.get('id')), strings.intern(build.get('name')),
+                               strings.intern(build.get('color')), float(build.get('price_eur') or 0),
+                               strings.intern(specs.get('groupset')), strings.intern(specs.get('wheelset')),
+                               strings.intern(specs.get('power_meter')),
+                               image_start, len(image_rows) - image_start, inv_start, len(inv_rows) - inv_start))
+        bike_rows.append((strings.intern(bike['id']), strings.intern(bike.get('brand')),
+                          strings.intern(bike.get('model')), strings.intern(bike.get('category')),
+                          strings.intern(bike.get('description')), strings.intern(bike.get('official_url')),
+                          int(bike.get('year') or 0), geo_start, len(geo_rows) - geo_start,
+                          build_start, len(build_rows) - build_start))
+
+    encoded = [s.encode('utf-8') for s in strings.values]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(e) for e in encoded]) if encoded else []
+    bikes_arr = np.array(bike_rows, dtype=BIKE_DTYPE)
+    id_order = sorted(range(len(bike_rows)), key=lambda i: strings.values[bike_rows[i][0]])
+    tables = {
+        'strdata': b''.join(encoded),
+        'stroffs': offsets,
+        'bikes': bikes_arr,
+        'geometry': np.array(geo_rows, dtype=GEOMETRY_DTYPE),
+        'builds': np.array(build_rows, dtype=BUILD_DTYPE),
+        'images': np.array(image_rows, dtype=IMAGE_DTYPE),
+        'inventory': np.array(inv_rows, dtype=INVENTORY_DTYPE),
+        'idindex': np.array(id_order, dtype='<u4'),
+    }
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        header_size = HEADER.size + SECTION.size * len(SECTIONS)
+        offset = -(-header_size // ALIGN) * ALIGN
+        layout = []
+        for name, _ in SECTIONS:
+            data = tables[name]
+            raw = data if isinstance(data, bytes) else data.tobytes()
+            count = len(data)
+            layout.append((name, offset, count, raw))
+            offset = -(-(offset + len(raw)) // ALIGN) * ALIGN
+        f.write(HEADER.pack(MAGIC, VERSION, len(SECTIONS)))
+        for name, off, count, _ in layout:
+            f.write(SECTION.pack(name.encode('ascii'), off, count))
+        for _, off, _, raw in layout:
+            f.write(b'\0' * (off - f.tell()))
+            f.write(raw)
+    os.replace(tmp, path)
+    return len(bike_rows)
+
+class GeometryView:
+    __slots__ = ('_snap', '_row')
+
+    def __init__(self, snap, row):
+        self._snap, self._row = snap, row
+
+    @property
+    def size(self):
+        return self._snap.string(self._snap.geometry['size'][self._row])
+
+    @property
+    def stack_mm(self):
+        return float(self._snap.geometry['stack'][self._row])
+
+    @property
+    def reach_mm(self):
+        return float(self._snap.geometry['reach'][self._row])
+
+    def to_dict(self):
+        g = self._snap.geometry[self._row]
+        def opt(v):
+            if np.isnan(v):
+                return None
+            v = round(float(v), 2)
+            return int(v) if v.is_integer() else v
+        geo = {'size': self.size, 'stack_mm': opt(g['stack']), 'reach_mm': opt(g['reach']),
+               'top_tube_mm': opt(g['top_tube']), 'seat_tube_mm': opt(g['seat_tube'])}
+        # Angles are only present for scraped geometry (geometry_scraper.py)
+        for key, column in (('seat_tube_angle', 'seat_angle'), ('head_tube_angle', 'head_angle')):
+            if not np.isnan(g[column]):
+                geo[key] = opt(g[column])
+        return geo
+
+class BuildView:
+    __slots__ = ('_snap', '_row')
+
+    def __init__(self, snap, row):
+        self._snap, self._row = snap, row
+
+    @property
+    def id(self):
+        return self._snap.string(self._snap.builds['id'][self._row])
+
+    @property
+    def price_eur(self):
+        return float(self._snap.builds['price'][self._row])
+
+    @property
+    def inventory(self):
+        s = self._snap
+        b = s.builds[self._row]
+        inv = s.inventory[b['inv_start']:b['inv_start'] + b['inv_count']]
+        return {s.string(r['size']): int(r['qty']) for r in inv}
+
+    def to_dict(self):
+        s = self._snap
+        b = s.builds[self._row]
+        images = s.images[b['image_start']:b['image_start'] + b['image_count']]
+        price = float(b['price'])
+        return {
+            'id': self.id, 'name': s.string(b['name']), 'color': s.string(b['color']),
+            'price_eur': int(price) if price.is_integer() else price,
+            'images': [s.string(i) for i in images['url']],
+            'specs': {'groupset': s.string(b['groupset']), 'wheelset': s.string(b['wheelset']),
+                      'power_meter': s.string(b['power_meter'])},
+            'inventory': self.inventory,
+        }
+
+class BikeView:
+    __slots__ = ('_snap', '_row')
+
+    def __init__(self, snap, row):
+        self._snap, self._row = snap, row
+
+    def _str(self, field):
+        return self._snap.string(self._snap.bikes[field][self._row])
+
+    @property
+    def id(self):
+        return self._str('id')
+
+    @property
+    def brand(self):
+        return self._str('brand')
+
+    @property
+    def model(self):
+        return self._str('model')
+
+    @property
+    def category(self):
+        return self._str('category')
+
+    @property
+    def year(self):
+        return int(self._snap.bikes['year'][self._row])
+
+    @property
+    def geometry(self):
+        b = self._snap.bikes[self._row]
+        return [GeometryView(self._snap, r) for r in range(b['geo_start'], b['geo_start'] + b['geo_count'])]
+
+    @property
+    def builds(self):
+        b = self._snap.bikes[self._row]
+        return [BuildView(self._snap, r) for r in range(b['build_start'], b['build_start'] + b['build_count'])]
+
+    def to_dict(self):
+        """The record in bikes.json form."""
+        return {
+            'id': self.id, 'brand': self.brand, 'model': self.model, 'year': self.year,
+            'category': self.category, 'description': self._str('description'),
+            'official_url': self._str('official_url'),
+            'geometry': [g.to_dict() for g in self.geometry],
+            'builds': [b.to_dict() for b in self.builds],
+        }
+
+class Snapshot:
+    """Read-only, memory-mapped catalog snapshot."""
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} catalog snapshot")
+        dtypes = dict(SECTIONS)
+        self._sections = {}
+        for i in range(count):
+            name, offset, items = SECTION.unpack_from(self._mm, HEADER.size + i * SECTION.size)
+            name = name.rstrip(b'\0').decode('ascii')
+            dtype = dtypes[name]
+            if dtype is None:
+                self._sections[name] = memoryview(self._mm)[offset:offset + items]
+            else:
+                self._sections[name] = np.frombuffer(self._mm, dtype=dtype, count=items, offset=offset)
+        self._strdata = self._sections['strdata']
+        self._stroffs = self._sections['stroffs']
+        self.bikes = self._sections['bikes']
+        self.geometry = self._sections['geometry']
+        self.builds = self._sections['builds']
+        self.images = self._sections['images']
+        self.inventory = self._sections['inventory']
+        self._idindex = self._sections['idindex']
+        self._string_cache = {}
+
+    def __len__(self):
+        return len(self.bikes)
+
+    def string(self, i):
+        i = int(i)
+        if i == NONE:
+            return None
+        s = self._string_cache.get(i)
+        if s is None:
+            s = self._string_cache[i] = bytes(self._strdata[self._stroffs[i]:self._stroffs[i + 1]]).decode('utf-8')
+        return s
+
+    def __iter__(self):
+        return (BikeView(self, i) for i in range(len(self.bikes)))
+
+    def bike(self, bike_id):
+        """Binary search over the id index; returns a BikeView or None."""
+        ids = _IdKeys(self)
+        i = bisect.bisect_left(ids, bike_id)
+        if i < len(ids) and ids[i] == bike_id:
+            return BikeView(self, int(self._idindex[i]))
+        return None
+
+    def geometry_index(self):
+        """matching.GeometryIndex straight from the geometry table (no JSON parsing)."""
+        from matching import GeometryIndex
+        return GeometryIndex.from_snapshot(self)
+
+    def close(self):
+        self._sections.clear()
+        self.bikes = self.geometry = self.builds = self.images = self.inventory = None
+        self._strdata = self._stroffs = self._idindex = None
+        self._mm.close()
+        self._file.close()
+
+class _IdKeys:
+    """Sequence of bike ids in idindex order, for bisect."""
+    def __init__(self, snap):
+        self._snap = snap
+
+    def __len__(self):
+        return len(self._snap._idindex)
+
+    def __getitem__(self, i):
+        return self._snap.string(self._snap.bikes['id'][self._snap._idindex[i]])
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile or inspect the binary catalog snapshot.")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--snapshot", default=SNAPSHOT_PATH, help="Snapshot file.")
+    parser.add_argument("--json", default=catalog_store.JSON_PATH, help="Legacy bikes.json path.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        catalog = catalog_store.open_catalog(args.json)
+        count = compile_snapshot(catalog, args.snapshot)
+        print(f"Compiled {count} bikes into {args.snapshot} ({os.path.getsize(args.snapshot) // 1024} KB).")
+    else:
+        start = time.perf_counter()
+        snap = Snapshot(args.snapshot)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{len(snap)} bikes, {len(snap.geometry)} sizes, {len(snap.builds)} builds, "
+              f"{len(snap.inventory)} inventory rows; opened in {elapsed:.2f} ms")
+
+if __name__ == "__main__":
+    main()
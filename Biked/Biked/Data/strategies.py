@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Hedged execution of prioritized image sources.
+# Strategies are (name, callable) pairs in priority order; each callable takes the run's
+# `cancelled` event and returns a result or None. The first one starts immediately, and
+# each lower-priority one starts speculatively when the running ones have been quiet for
+# `hedge_delay` seconds (or as soon as every running one has failed). The highest-priority
+# success wins and the rest are cancelled: queued ones never start, and running ones see
+# the event set and stop at their next step (before the next request they would make).
+
+HEDGE_DELAY = 3.0    # Seconds before a lower-priority source is launched speculatively
+DEADLINE = 60.0      # After this, take the best success so far instead of waiting
+MAX_WORKERS = 32
+
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='strategy')
+
+_FAILED = object()
+
+def _call(fn, cancelled):
+    if cancelled.is_set():
+        return None
+    return fn(cancelled)
+
+def run_hedged(strategies, hedge_delay=HEDGE_DELAY, deadline=DEADLINE, pool=None, errors=None):
+    """
+    Returns (result, strategy_name); (None, None) when every strategy failed.
+    Exceptions raised by strategies count as failures and are appended to errors if given.
+    """
+    pool = pool or _pool
+    cancelled = threading.Event()
+    started = time.monotonic()
+    futures = []   # index -> future, in launch (= priority) order
+    outcomes = {}  # index -> result or _FAILED
+
+    def launch():
+        name, fn = strategies[len(futures)]
+        futures.append(pool.submit(_call, fn, cancelled))
+
+    def settle(index):
+        try:
+            outcomes[index] = futures[index].result() or _FAILED
+        except Exception as e:
+            print(f"    [Strategy {strategies[index][0]}] error: {e}")
+            if errors is not None:
+                errors.append(e)
+            outcomes[index] = _FAILED
+
+    def decide(timed_out):
+        """Highest-priority success whose betters have all failed (or any success past the deadline)."""
+        for index in range(len(futures)):
+            outcome = outcomes.get(index)
+            if outcome is None:
+                if not timed_out:
+                    return None
+                continue
+            if outcome is not _FAILED:
+                return index
+        return None
+
+    if not strategies:
+        return None, None
+    launch()
+    try:
+        while True:
+            pending = [f for i, f in enumerate(futures) if i not in outcomes]
+            timed_out = time.monotonic() - started > deadline
+            winner = decide(timed_out)
+            if winner is not None:
+                return outcomes[winner], strategies[winner][0]
+
+            has_next = len(futures) < len(strategies)
+            if not pending:
+                if not has_next:
+                    return None, None
+                launch()  # Everything running so far failed: no reason to wait
+                continue
+            if timed_out and not has_next:
+                # Nothing left to hedge with and no success yet: keep waiting on what runs
+                timeout = None
+            else:
+                timeout = hedge_delay if has_next else max(0.0, deadline - (time.monotonic() - started))
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                settle(futures.index(future))
+            if not done and has_next:
+                launch()  # Hedge: the running sources are slow, start the next one
+    finally:
+        cancelled.set()
+        for future in futures:
+            future.cancel()